@@ -0,0 +1,164 @@
+"""Benchmark suite of the DHW profile generator on the synthetic fixtures in benchmarks/fixtures.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+
+Every stage is timed separately, results are written as JSON, and a run can be compared against a stored baseline:
+stages slower than the baseline by more than the tolerance are reported and make the script exit with 1."""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from os.path import abspath, dirname, join
+from statistics import median
+from time import perf_counter
+
+benchmark_directory = dirname(abspath(__file__))
+repository_directory = dirname(benchmark_directory)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of every stage, the best one counts")
+    parser.add_argument("--households", type=int, nargs="+", default=[1, 100, 10000],
+                        help="population sizes of the end-to-end scaling curve")
+    return parser.parse_args()
+
+
+def timeit(function, repeat):
+    """Runs function repeat times, returns best and median wall time in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return {"best": min(times), "median": median(times), "repeat": repeat}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repository_directory, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    import numpy
+    import pandas
+    return {"python": platform.python_version(), "numpy": numpy.__version__, "pandas": pandas.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "commit": commit}
+
+
+def run(arguments):
+    import numpy as np
+    import pandas as pd
+
+    from domestic_hot_water.domestic_hot_water_definitions import DiscreteProfile, WaterHeaterData, \
+        _l_per_discrete_profile
+    from domestic_hot_water.domestic_hot_water_profile import DomesticHotWaterProfile, IndividualHotWaterProfile, \
+        DrawOffSamplingIndex
+
+    input_file = join("fixtures", "dhwp.txt")
+    year = 2021
+    days = pd.date_range(start=f"{year}-01-01", end=f"{year}-12-31")
+    repeat = arguments.repeat
+    stages = {}
+
+    stages["DomesticHotWaterProfile.__init__"] = timeit(
+        lambda: DomesticHotWaterProfile(input_file, year, cache=None), repeat)
+    dhwp = DomesticHotWaterProfile(input_file, year, cache=None)
+    for resolution in ("1h", "15min"):
+        stages[f"return_yearly_profile[{resolution}]"] = timeit(
+            lambda: dhwp.return_yearly_profile(days, resolution), repeat)
+
+    ihwp = IndividualHotWaterProfile(dhwp)
+    yearly_profile = dhwp.return_yearly_profile(days, "1h")
+    stages["DrawOffSamplingIndex"] = timeit(lambda: DrawOffSamplingIndex(yearly_profile), repeat)
+    sampling_index = DrawOffSamplingIndex(yearly_profile)
+    daily_volumes = {profile: _l_per_discrete_profile.get(profile, 1000) for profile in DiscreteProfile}
+    for profile, daily_volume in daily_volumes.items():
+        vol_water_used = daily_volume * 365.
+        occurrences = ihwp._get_discrete_water_usage(vol_water_used)
+        stages[f"_create_final_profile[{profile.name}, {daily_volume} l/day]"] = timeit(
+            lambda: ihwp._create_final_profile(yearly_profile, occurrences, vol_water_used, sampling_index), repeat)
+
+    heater_data = WaterHeaterData()
+    volumes = np.linspace(20, 2 * heater_data.max_w_heater_size, 200)
+    powers = np.linspace(0.5, 2 * heater_data.max_power, 200)
+    stages["WaterHeaterData.get_heater_data[200]"] = timeit(
+        lambda: [heater_data.get_heater_data(volume) for volume in volumes], repeat)
+    stages["WaterHeaterData.find_heater_by_power[200]"] = timeit(
+        lambda: [heater_data.find_heater_by_power(power) for power in powers], repeat)
+    stages["WaterHeaterData.get_larger_heater_data[200]"] = timeit(
+        lambda: [heater_data.get_larger_heater_data(volume) for volume in volumes], repeat)
+    stages["WaterHeaterData.get_multiple_water_heaters[200]"] = timeit(
+        lambda: [heater_data.get_multiple_water_heaters(vol_water_l=volume) for volume in volumes], repeat)
+    stages["WaterHeaterData.get_heater_data_batch[200]"] = timeit(
+        lambda: heater_data.get_heater_data_batch(volumes), repeat)
+    stages["WaterHeaterData.find_heater_by_power_batch[200]"] = timeit(
+        lambda: heater_data.find_heater_by_power_batch(powers), repeat)
+
+    def end_to_end(e_yearly):
+        profile = DomesticHotWaterProfile(input_file, year, cache=None)
+        IndividualHotWaterProfile(profile).get_population_profile_from_e_yearly(
+            e_yearly, year, "1h", rng=np.random.default_rng(0))
+
+    scaling = {"households": [], "best": []}
+    for n_households in arguments.households:
+        e_yearly = np.random.default_rng(n_households).uniform(500., 4000., n_households)
+        result = timeit(lambda: end_to_end(e_yearly), max(1, min(repeat, 10000 // n_households)))
+        stages[f"end_to_end[{n_households} households]"] = result
+        scaling["households"].append(n_households)
+        scaling["best"].append(result["best"])
+
+    return {"environment": environment(), "stages": stages, "scaling": scaling}
+
+
+def compare(results, baseline, tolerance):
+    """Prints the ratio against the baseline per stage, returns the names of the regressed stages."""
+    regressions = []
+    for name, result in results["stages"].items():
+        if name not in baseline["stages"]:
+            print(f"{name:<60} {result['best']:10.5f} s   (new)")
+            continue
+        ratio = result["best"] / baseline["stages"][name]["best"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "REGRESSION"
+        print(f"{name:<60} {result['best']:10.5f} s   x{ratio:5.2f} {flag}")
+    return regressions
+
+
+def main():
+    arguments = parse_arguments()
+    # utility.configuration takes the config file from argv[2] if given, else from <cwd>/config/config.ini:
+    # run from the benchmarks directory and hide the benchmark's own arguments
+    output = abspath(arguments.output) if arguments.output else None
+    baseline = abspath(arguments.baseline) if arguments.baseline else None
+    os.chdir(benchmark_directory)
+    sys.argv = sys.argv[:1]
+    sys.path.insert(0, repository_directory)
+
+    results = run(arguments)
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), arguments.tolerance)
+    else:
+        regressions = []
+        for name, result in results["stages"].items():
+            print(f"{name:<60} {result['best']:10.5f} s")
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Benchmark results written to: {output}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than the baseline by more than {arguments.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
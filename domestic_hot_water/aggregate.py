@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.profile_output import ProfileWriter
+
+
+class QuantileSketch:
+    """Per-timestep quantile sketch with a bounded relative error (log-spaced buckets, as in DDSketch).
+
+    Memory is n_buckets x timesteps counters whatever the number of households. Values below min_value count as zero,
+    values above max_value fall into the last bucket."""
+
+    def __init__(self, n_steps, relative_accuracy=0.05, min_value=1e-3, max_value=1e6):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.min_value = min_value
+        self.offset = int(np.floor(np.log(min_value) / np.log(self.gamma)))
+        n_buckets = int(np.ceil(np.log(max_value) / np.log(self.gamma))) - self.offset + 1
+        # Row 0 counts zeros, row i > 0 counts values in (gamma^(i + offset - 1), gamma^(i + offset)]
+        self.counts = np.zeros((n_buckets + 1, n_steps), dtype=np.uint32)
+        self.n = 0
+
+    def update(self, profiles):
+        """Adds a households x timesteps chunk."""
+        n_households, n_steps = profiles.shape
+        buckets = np.zeros(profiles.shape, dtype=np.int64)
+        nonzero = profiles >= self.min_value
+        buckets[nonzero] = np.clip(np.ceil(np.log(profiles[nonzero]) / np.log(self.gamma)).astype(np.int64)
+                                   - self.offset, 1, len(self.counts) - 1)
+        self.counts += np.bincount((buckets * n_steps + np.arange(n_steps)).ravel(),
+                                   minlength=self.counts.size).reshape(self.counts.shape).astype(np.uint32)
+        self.n += n_households
+
+    def quantile(self, q):
+        """Returns the q-quantile (0 <= q <= 1) of every timestep."""
+        rank = q * (self.n - 1)
+        bucket = np.argmax(self.counts.cumsum(axis=0) > rank, axis=0)
+        exponent = bucket + self.offset
+        return np.where(bucket == 0, 0., 2 * self.gamma ** exponent / (self.gamma + 1))
+
+
+class FeederAggregator(ProfileWriter):
+    """Reduces a stream of household profiles to feeder-level statistics, never keeping the households.
+
+    Keeps the aggregate (sum) profile, per-timestep mean and variance over households (Welford, merged chunk by
+    chunk), per-timestep percentiles from a QuantileSketch, the aggregate peak and the coincidence factor (aggregate
+    peak over the sum of the household peaks). Memory is O(timesteps)."""
+
+    def __init__(self, index, year, resolution, percentiles=(5, 50, 95), filename=None, relative_accuracy=0.05):
+        super().__init__(index, year, resolution)
+        self.percentiles = percentiles
+        self.filename = filename
+        self.total = np.zeros(len(index))
+        self.mean = np.zeros(len(index))
+        self.m2 = np.zeros(len(index))
+        self.sum_of_household_peaks = 0.
+        self.sketch = QuantileSketch(len(index), relative_accuracy)
+
+    def write(self, metadata, profiles):
+        profiles = np.asarray(profiles, dtype=float)
+        n_a, n_b = self.n_households, len(profiles)
+        if n_b == 0:
+            return
+        mean_b = profiles.mean(axis=0)
+        m2_b = ((profiles - mean_b) ** 2).sum(axis=0)
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / (n_a + n_b)
+        self.m2 += m2_b + delta ** 2 * n_a * n_b / (n_a + n_b)
+        self.total += profiles.sum(axis=0)
+        self.sum_of_household_peaks += profiles.max(axis=1).sum()
+        self.sketch.update(profiles)
+        self.n_households += n_b
+
+    @property
+    def peak(self):
+        return self.total.max()
+
+    @property
+    def coincidence_factor(self):
+        return self.peak / self.sum_of_household_peaks if self.sum_of_household_peaks > 0 else np.nan
+
+    def result(self):
+        """Returns the per-timestep statistics in l/h as a DataFrame."""
+        statistics = {"sum": self.total, "mean": self.mean,
+                      "std": np.sqrt(self.m2 / (self.n_households - 1)) if self.n_households > 1 else
+                      np.zeros_like(self.m2)}
+        for percentile in self.percentiles:
+            statistics[f"p{percentile:g}"] = self.sketch.quantile(percentile / 100)
+        return pd.DataFrame(statistics, index=self.index)
+
+    def summary(self):
+        """Returns the population-level figures."""
+        return {"households": self.n_households, "peak": self.peak, "peak_time": self.index[self.total.argmax()],
+                "sum_of_household_peaks": self.sum_of_household_peaks,
+                "coincidence_factor": self.coincidence_factor}
+
+    def close(self):
+        if self.filename is None:
+            return
+        self.result().to_csv(self.filename)
+        pd.Series(self.summary()).to_csv(f"{self.filename[:-len('.csv')]}_summary.csv", header=False)
+        print(f"Aggregate DHW profile of {self.n_households} households written to: {self.filename}")
@@ -1,9 +1,13 @@
 from enum import Enum
+from functools import lru_cache
 from math import ceil
 from os.path import join
 
+import numpy as np
 import pandas as pd
 
+from utility.configuration import config
+from utility.instrumentation import timed
 
 
 class DiscreteProfile(Enum):
@@ -47,15 +51,48 @@ draw_off_statistics = {
     DiscreteProfile.HEAVY: pd.DataFrame([[28, 1], [12, 6], [2, 40], [1, 140]], columns=cols, index=draw_offs),
 }
 
+@lru_cache(maxsize=None)
+@timed("load_water_heater_data")
+def load_water_heater_data(filename):
+    """Reads the water heater table once per file."""
+    return pd.read_csv(filename, delimiter=';', header=0, index_col=0).transpose().sort_values(by="Volume")
+
+
+def _water_heater_file(input_directory=None):
+    if input_directory is None:
+        input_directory = config.get("path", "input")
+    return join(input_directory, "water_heater.csv")
+
+
+class _WaterHeaterTable:
+    """Attribute read from the water heater table on access, both on WaterHeaterData and on its instances: from the
+    instance's input_directory if it has one, else from the input path of the active config."""
+    def __init__(self, derive=None):
+        self.derive = derive
+
+    def __get__(self, instance, owner):
+        table = load_water_heater_data(_water_heater_file(getattr(instance, "input_directory", None)))
+        return table if self.derive is None else self.derive(table)
+
+
 class WaterHeaterData:
-    """A class to manage data related to water heaters."""
-    from utility.configuration import config
+    """A class to manage data related to water heaters, read from water_heater.csv in the input path on first use.
+
+    input_directory binds an instance to the water_heater.csv of that directory, by default it follows the active
+    config.
+
+    The *_batch methods are the vectorized counterparts of the scalar lookups: they take arrays of volumes or powers
+    and return a DataFrame with one row per input, the heater's name in "Heater" and the number of combined heaters
+    in "Count". They search the precomputed sorted arrays of sorted_index instead of filtering the table per call."""
+    scaled_columns = ["Volume", "Power", "Mass", "Area", "Energy loss kW", "Heat transfer coefficient"]
+    water_heater_data = _WaterHeaterTable()
+    max_w_heater_size = _WaterHeaterTable(lambda table: table["Volume"].max())
+    max_power = _WaterHeaterTable(lambda table: table["Power"].max())
 
-    water_heater_data = pd.read_csv(join(config.get("path", "input"), "water_heater.csv"), delimiter=';', header=0,
-                                    index_col=0).transpose().sort_values(by="Volume")
-    max_w_heater_size = water_heater_data["Volume"].max()
-    max_power = water_heater_data["Power"].max()
+    def __init__(self, input_directory=None):
+        self.input_directory = input_directory
 
+    @timed("WaterHeaterData.get_heater_data")
     def get_heater_data(self, vol_water_l):
         """Retrieves heater data for a given water volume."""
         if vol_water_l in self.water_heater_data.Volume.values:
@@ -63,6 +100,7 @@ class WaterHeaterData:
 
         return self.get_multiple_water_heaters(vol_water_l = vol_water_l)
 
+    @timed("WaterHeaterData.find_heater_by_power")
     def find_heater_by_power(self, power_kwh):
         """Finds a heater by its power rating."""
         if power_kwh <= self.max_power:
@@ -80,12 +118,85 @@ class WaterHeaterData:
         if power_kwh is not None:
             mul = ceil(power_kwh / self.max_power)
             heater = self.water_heater_data[self.water_heater_data.Power == self.max_power].iloc[0].copy()
-        heater[["Volume", "Power", "Mass", "Area", "Energy loss kW", "Heat transfer coefficient"]] *= mul
+        heater[self.scaled_columns] *= mul
         return heater.squeeze()
 
+    @timed("WaterHeaterData.get_larger_heater_data")
     def get_larger_heater_data(self, vol_water_l):
         """Retrieves data for a heater larger than the specified volume."""
         if vol_water_l > self.max_w_heater_size:
             return self.get_multiple_water_heaters(vol_water_l*2)
 
         return self.water_heater_data[self.water_heater_data.Volume > vol_water_l].iloc[0].squeeze()
+
+    @property
+    def sorted_index(self):
+        """Volumes in ascending order, the running maximum of the powers in that order and the positions of the
+        largest heater by volume and by power."""
+        return _sorted_heater_index(_water_heater_file(self.input_directory))
+
+    def _heaters(self, positions, multipliers):
+        heaters = self.water_heater_data.iloc[positions]
+        heaters = heaters.rename_axis("Heater").reset_index().rename_axis(columns=None)
+        heaters[self.scaled_columns] = heaters[self.scaled_columns].astype(float).mul(multipliers, axis=0)
+        heaters["Count"] = multipliers
+        return heaters
+
+    @timed("WaterHeaterData.get_heater_data_batch")
+    def get_heater_data_batch(self, vol_water_l):
+        """Vectorized get_heater_data."""
+        volumes, _, _, _ = self.sorted_index
+        vol_water_l = np.atleast_1d(np.asarray(vol_water_l, dtype=float))
+        position = np.minimum(np.searchsorted(volumes, vol_water_l), len(volumes) - 1)
+        exact = volumes[position] == vol_water_l
+        multiple = self.get_multiple_water_heaters_batch(vol_water_l=vol_water_l[~exact])
+        return self._merge(exact, self._heaters(position[exact], np.ones(exact.sum(), dtype=int)), multiple)
+
+    @timed("WaterHeaterData.find_heater_by_power_batch")
+    def find_heater_by_power_batch(self, power_kwh):
+        """Vectorized find_heater_by_power."""
+        _, running_max_power, _, _ = self.sorted_index
+        power_kwh = np.atleast_1d(np.asarray(power_kwh, dtype=float))
+        fits = power_kwh <= running_max_power[-1]
+        position = np.searchsorted(running_max_power, power_kwh[fits])
+        multiple = self.get_multiple_water_heaters_batch(power_kwh=power_kwh[~fits])
+        return self._merge(fits, self._heaters(position, np.ones(len(position), dtype=int)), multiple)
+
+    @timed("WaterHeaterData.get_larger_heater_data_batch")
+    def get_larger_heater_data_batch(self, vol_water_l):
+        """Vectorized get_larger_heater_data; a volume equal to the largest heater's gets combined heaters for twice
+        the volume, where the scalar lookup finds no larger heater and raises IndexError."""
+        volumes, _, _, _ = self.sorted_index
+        vol_water_l = np.atleast_1d(np.asarray(vol_water_l, dtype=float))
+        fits = vol_water_l < volumes[-1]
+        position = np.minimum(np.searchsorted(volumes, vol_water_l[fits], side="right"), len(volumes) - 1)
+        multiple = self.get_multiple_water_heaters_batch(vol_water_l=vol_water_l[~fits] * 2)
+        return self._merge(fits, self._heaters(position, np.ones(len(position), dtype=int)), multiple)
+
+    def get_multiple_water_heaters_batch(self, vol_water_l=None, power_kwh=None):
+        """Vectorized get_multiple_water_heaters."""
+        volumes, running_max_power, largest_by_volume, largest_by_power = self.sorted_index
+        if vol_water_l is not None:
+            multipliers = np.ceil(np.atleast_1d(np.asarray(vol_water_l, dtype=float)) / volumes[-1])
+            position = largest_by_volume
+        else:
+            multipliers = np.ceil(np.atleast_1d(np.asarray(power_kwh, dtype=float)) / running_max_power[-1])
+            position = largest_by_power
+        multipliers = multipliers.astype(int)
+        return self._heaters(np.full(len(multipliers), position), multipliers)
+
+    @staticmethod
+    def _merge(mask, selected, others):
+        """Interleaves the rows for mask == True and the rest back into input order."""
+        heaters = pd.concat([selected, others], ignore_index=True)
+        order = np.concatenate([np.flatnonzero(mask), np.flatnonzero(~mask)])
+        return heaters.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+
+
+@lru_cache(maxsize=None)
+def _sorted_heater_index(filename):
+    water_heater_data = load_water_heater_data(filename)
+    volumes = water_heater_data["Volume"].values.astype(float)
+    powers = water_heater_data["Power"].values.astype(float)
+    return volumes, np.maximum.accumulate(powers), int(np.argmax(volumes == volumes.max())), \
+        int(np.argmax(powers == powers.max()))
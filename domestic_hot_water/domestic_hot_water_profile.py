@@ -1,17 +1,34 @@
+import calendar
 import logging
 import random
 
-import holidays
 import numpy as np
 import pandas as pd
 
 from domestic_hot_water.domestic_hot_water_definitions import DiscreteProfile, ContinuousProfile, draw_off_statistics, \
     _l_per_discrete_profile, multiply_heavy_profile, WaterHeaterData
-from utility.configuration import config
+from domestic_hot_water.events import DrawOffEvents
+from domestic_hot_water.profile_cache import profile_cache, file_content_hash
+from domestic_hot_water.sub_hourly import steps_per_hour, day_templates
+from utility.configuration import config, ConfigValue
+from utility.definitions import seed
+from utility.instrumentation import instrumentation, timed
 
-random.seed(42)
 logger = logging.getLogger(__name__)
 
+
+@timed("country_holidays")
+def country_holidays(country, years):
+    """Holiday calendar of the country, holidays is only imported when a calendar is needed."""
+    import holidays
+    return holidays.country_holidays(country, years=years)
+
+
+def days_in_year(year):
+    """Number of days of the year, 366 in leap years."""
+    return 366 if calendar.isleap(year) else 365
+
+
 class DomesticHotWaterProfile:
     # Statistical analysis, András Horkai
     _daily_consumption_per_apartment = 90.34
@@ -25,19 +42,47 @@ class DomesticHotWaterProfile:
     # calculation in Finnish... (Ahmed et al.)
     _weekend_consumption_coefficient = 1.18
 
-    def __init__(self, input_file, year):
+    def __init__(self, input_file, year, cache=profile_cache, holiday_countries=None):
+        """Parses the DHW pattern file; cache is a ProfileCache for parsed inputs and yearly profiles, or None.
+
+        holiday_countries are the countries whose public holidays count as weekend days, by default
+        time.holiday_countries from the config (Hungary if not set)."""
         self.year = year
-        self.df = pd.read_csv(input_file, header=None).transpose()
-        self.df.columns = pd.MultiIndex.from_arrays(self.df.iloc[0:3].values)
-        self.df = self.df.iloc[3:]
-        self.df = self.df[self.df.columns[self.df.columns.get_level_values(0) == "August"]]
-        self.df /= self.df.sum()
-        self.df = self.df.apply(pd.to_numeric, errors="coerce")
+        if holiday_countries is None:
+            holiday_countries = config.get("time", "holiday_countries", fallback="Hungary")
+        self.holiday_countries = [holiday_countries] if isinstance(holiday_countries, str) else list(holiday_countries)
+        self._holiday_dates = {}
+        self._cache = cache
+        self._input_hash = file_content_hash(input_file)
+        self.df = self._cached(("dhwp", self._input_hash), lambda: self._read_input(input_file))
         self.daily_consumption = self._monthly_consumption_multiplier
-        self._hungary_holidays = holidays.country_holidays("Hungary", years=year)
+
+    def holiday_dates(self, year):
+        """Sorted datetime64[D] array of the holidays of the year in any of the holiday countries, built once."""
+        if year not in self._holiday_dates:
+            dates = set()
+            for country in self.holiday_countries:
+                dates.update(country_holidays(country, year).keys())
+            self._holiday_dates[year] = np.array(sorted(dates), dtype="datetime64[D]")
+        return self._holiday_dates[year]
+
+    @staticmethod
+    @timed("DomesticHotWaterProfile._read_input")
+    def _read_input(input_file):
+        df = pd.read_csv(input_file, header=None).transpose()
+        df.columns = pd.MultiIndex.from_arrays(df.iloc[0:3].values)
+        df = df.iloc[3:]
+        df = df[df.columns[df.columns.get_level_values(0) == "August"]]
+        df /= df.sum()
+        return df.apply(pd.to_numeric, errors="coerce")
+
+    def _cached(self, key, factory):
+        if self._cache is None:
+            return factory()
+        return self._cache.get_or_create(key, factory)
 
     def is_holiday(self, day):
-        return day in self._hungary_holidays
+        return bool(np.isin(np.datetime64(pd.Timestamp(day).date(), "D"), self.holiday_dates(day.year)))
 
     def is_weekend(self, day):
         return not day.weekday() >= 5
@@ -60,17 +105,125 @@ class DomesticHotWaterProfile:
         df.index = pd.date_range(start=day, end=day + pd.Timedelta(hours=23), freq='h')
         return df
 
-    def return_yearly_profile(self, days_of_year, resolution=config.get("time", "resolution")):
-        output_df = pd.concat([self.get_day(day) for day in days_of_year], axis="rows")
-        if resolution == "1h":
-            output_df /= output_df.sum()
-            return output_df
-        elif resolution == "15min":
-            output_df = output_df.resample('15min').mean().interpolate(method="spline", order=3)
-            output_df /= output_df.sum()
-            return output_df
+    @timed("DomesticHotWaterProfile.return_yearly_profile")
+    def return_yearly_profile(self, days_of_year, resolution=None, interpolation="template", cache=True):
+        """Returns the normalised yearly base profile at the resolution (1min, 5min, 15min or 1h).
+
+        Sub-hourly profiles are tiled from per-day-type templates (see sub_hourly.day_templates) by default;
+        interpolation="spline" uses the former cubic spline interpolation over the whole year instead. With
+        cache=False the profile is built without looking it up in or adding it to the cache."""
+        if resolution is None:
+            resolution = config.get("time", "resolution")
+        days_of_year = pd.DatetimeIndex(days_of_year)
+        if not cache:
+            return self._build_yearly_profile(days_of_year, resolution, interpolation)
+        holiday_calendar = tuple(days_of_year[self._holiday_mask(days_of_year)].strftime("%Y-%m-%d"))
+        key = ("yearly_profile", self._input_hash, str(days_of_year[0].date()), str(days_of_year[-1].date()),
+               len(days_of_year), resolution, interpolation, holiday_calendar)
+        return self._cached(key, lambda: self._build_yearly_profile(days_of_year, resolution, interpolation))
+
+    def _day_type_matrices(self):
+        """Returns the (weekday, weekend) x hours x profiles array of the hourly distributions and the profile names."""
+        day_types = []
+        for day_type in ("Weekday", "Weekend"):
+            df = self.df[self.df.columns[self.df.columns.get_level_values(1) == day_type]]
+            df.columns = df.columns.get_level_values(2)
+            day_types.append(df)
+        columns = day_types[0].columns
+        return np.stack([df[columns].values for df in day_types]), columns
+
+    def _holiday_mask(self, days_of_year):
+        holiday_dates = np.concatenate([self.holiday_dates(year) for year in np.unique(days_of_year.year)])
+        return np.isin(days_of_year.values.astype("datetime64[D]"), holiday_dates)
+
+    def get_days(self, days_of_year, resolution="1h"):
+        """Vectorized version of concatenating get_day over days_of_year.
+
+        Every day gets a day-type code (0: weekday, 1: weekend or holiday) and a multiplier (monthly consumption
+        multiplier, times the weekend coefficient on weekends and holidays); the year is then gathered from the
+        day-type hour matrices in one go. Below 1h, the day-type matrices are the interpolated day templates."""
+        days_of_year = pd.DatetimeIndex(days_of_year)
+        matrices, columns = self._day_type_matrices()
+        matrices = day_templates(matrices, steps_per_hour(resolution))
+        day_type = ((days_of_year.weekday >= 5) | self._holiday_mask(days_of_year)).astype(np.intp)
+        consumption_coefficient = np.where(day_type == 1, self._weekend_consumption_coefficient, 1)
+        multiplier = np.asarray(self._monthly_consumption_multiplier)[days_of_year.month - 1] * consumption_coefficient
+
+        values = np.empty((len(days_of_year), matrices.shape[1], matrices.shape[2]))
+        np.multiply(matrices[day_type], multiplier[:, None, None], out=values)
+        step = np.timedelta64(pd.Timedelta(resolution))
+        index = (days_of_year.values[:, None] + np.arange(matrices.shape[1]) * step).ravel()
+        return pd.DataFrame(values.reshape(-1, matrices.shape[2]), columns=columns,
+                            index=pd.DatetimeIndex(index, freq="infer" if len(index) > 2 else None))
+
+    @timed("DomesticHotWaterProfile._build_yearly_profile")
+    def _build_yearly_profile(self, days_of_year, resolution, interpolation="template"):
+        steps_per_hour(resolution)
+        if resolution == "1h" or interpolation == "template":
+            output_df = self.get_days(days_of_year, resolution)
+        elif interpolation == "spline":
+            output_df = self.get_days(days_of_year).resample(resolution).mean().interpolate(method="spline", order=3)
         else:
-            raise ValueError(f"Unknown resolution {resolution}")
+            raise ValueError(f"Unknown interpolation {interpolation}")
+        output_df /= output_df.sum()
+        return output_df
+
+
+class DrawOffSamplingIndex:
+    """Ranked time steps of a base yearly profile, built once and reused to place draw-offs of many households.
+
+    A draw-off lands on a uniformly chosen base profile column, at a uniformly chosen time step out of the upper half
+    of that column's ranking (same order as nlargest). Zero time steps are never drawn: they sit at the tail of the
+    ranking, so they are cut off from the candidates instead of being rejected."""
+
+    @timed("DrawOffSamplingIndex.__init__")
+    def __init__(self, yearly_profile):
+        values = yearly_profile.values
+        self.index = yearly_profile.index
+        self.columns = yearly_profile.columns
+        self.order = np.ascontiguousarray(np.argsort(-values, axis=0, kind="stable").T)
+        self.n_candidates = np.minimum(np.count_nonzero(values > 0, axis=0), len(values) // 2 + 1)
+        if np.any(self.n_candidates == 0):
+            raise ValueError("Base profile column without any non-zero time step")
+
+    @classmethod
+    def from_arrays(cls, order, n_candidates, index=None, columns=None):
+        """Recreates an index from its arrays, e.g. views of shared memory in a worker process."""
+        sampling_index = cls.__new__(cls)
+        sampling_index.order = order
+        sampling_index.n_candidates = n_candidates
+        sampling_index.index = index
+        sampling_index.columns = columns
+        return sampling_index
+
+    @property
+    def n_steps(self):
+        return self.order.shape[1]
+
+    def draw(self):
+        """Draws the position of a single time step using the random module."""
+        column = random.randrange(self.order.shape[0])
+        return self.order[column, random.randrange(self.n_candidates[column])]
+
+    def sample(self, size, rng):
+        """Draws the positions of size time steps using a numpy Generator."""
+        column = rng.integers(0, self.order.shape[0], size=size)
+        rank = (rng.random(size) * self.n_candidates[column]).astype(np.int64)
+        return self.order[column, rank]
+
+    def sample_bits(self, bits):
+        """Maps uint64 random bits to time step positions: the upper 32 bits pick the column, the lower 32 the rank in
+        its candidates (multiply-shift, no float conversion). bits is overwritten."""
+        column = bits >> np.uint64(32)
+        column *= np.uint64(self.order.shape[0])
+        column >>= np.uint64(32)
+        bits &= np.uint64(0xFFFFFFFF)
+        bits *= self.n_candidates.astype(np.uint64)[column]
+        bits >>= np.uint64(32)
+        # Flat position in order: column * n_steps + rank
+        column *= np.uint64(self.n_steps)
+        column += bits
+        return self.order.reshape(-1).take(column.view(np.int64))
 
 
 class IndividualHotWaterProfile:
@@ -78,36 +231,161 @@ class IndividualHotWaterProfile:
     # Based on KSH 2014 -- did not change radically since then
     water_consumption_per_person_per_day = 58.58
     c = 0.00116667  # kWh/kg/°C
-    loss_coefficient = config.getfloat("domestic_hot_water", "loss_coefficient")
-    stored_water_temp = config.getfloat("domestic_hot_water", "stored_water_temp")
-    cold_water_temp = config.getfloat("domestic_hot_water", "cold_water_temp")
-    hot_water_temp = config.getfloat("domestic_hot_water", "hot_water_temp")
+    loss_coefficient = ConfigValue("domestic_hot_water", "loss_coefficient", "getfloat")
+    stored_water_temp = ConfigValue("domestic_hot_water", "stored_water_temp", "getfloat")
+    cold_water_temp = ConfigValue("domestic_hot_water", "cold_water_temp", "getfloat")
+    hot_water_temp = ConfigValue("domestic_hot_water", "hot_water_temp", "getfloat")
     water_heater_data = WaterHeaterData()
-    year = config.getint("time", "simulation_year")
+    year = ConfigValue("time", "simulation_year", "getint")
 
     def __init__(self, domestic_hot_water_profile):
         """Initializes the IndividualHotWaterProfile with a DHW profile object."""
         self.yearly_dhw = domestic_hot_water_profile
+        self._sampling_indices = {}
+
+    def _get_sampling_index(self, yearly_profile, year, resolution):
+        """Returns the draw-off sampling index of the base profile, built once per year and resolution."""
+        if (year, resolution) not in self._sampling_indices:
+            self._sampling_indices[(year, resolution)] = DrawOffSamplingIndex(yearly_profile)
+        return self._sampling_indices[(year, resolution)]
 
-    def get_individual_profile_from_e_yearly(self, e_yearly_controlled, year=None):
-        """Generates an individual hot water profile based on yearly energy consumption."""
+    @timed("IndividualHotWaterProfile.get_individual_profile_from_e_yearly")
+    def get_individual_profile_from_e_yearly(self, e_yearly_controlled, year=None, rng=None):
+        """Generates an individual hot water profile based on yearly energy consumption.
+
+        Without rng the draw-offs come from the random module, seeded by seed_global_random_states of
+        utility/definitions.py, not at import; with a numpy Generator the profile only depends on that generator and
+        equals the household's row of get_population_profile_from_e_yearly up to float rounding (see KeyedHouseholds
+        in keyed_households.py)."""
         if year is None:
             year = self.year
+        resolution = config.get("time", "resolution")
         yearly_profile = self.yearly_dhw.return_yearly_profile(
-            pd.date_range(start=f"{year}-01-01", end=f"{year}-12-31"))
+            pd.date_range(start=f"{year}-01-01", end=f"{year}-12-31"), resolution)
 
         if np.isnan(e_yearly_controlled) or e_yearly_controlled == 0.:
             return None
 
         vol_water_used, n_people = IndividualHotWaterProfile.calc_number_of_occupants(
             e_yearly_controlled)
-        discrete_water_usage_occurrences = self._get_discrete_water_usage(vol_water_used)
+        discrete_water_usage_occurrences = self._get_discrete_water_usage(vol_water_used, days_in_year(year))
+
+        return self._create_final_profile(yearly_profile, discrete_water_usage_occurrences, vol_water_used,
+                                          self._get_sampling_index(yearly_profile, year, resolution), rng)
+
+    def get_population_profile_from_e_yearly(self, e_yearly_controlled, year=None, resolution=None, rng=None,
+                                             as_frame=False):
+        """Generates hot water profiles for a whole population of households at once.
+
+        Returns a households x timesteps array in l/h (households with zero or NaN yearly energy get an all-zero row),
+        or a wide DataFrame with one column per household if as_frame is set. rng is either a numpy Generator shared
+        by the population or a sequence of Generators, one per household."""
+        if year is None:
+            year = self.year
+        if resolution is None:
+            resolution = config.get("time", "resolution")
+        if rng is None:
+            rng = np.random.default_rng(seed)
+        sampling_index = self.get_sampling_index(year, resolution)
+        profiles = self.generate_population(sampling_index, e_yearly_controlled, rng, days_in_year(year))
+        profiles, index = self._resample_population(profiles, sampling_index.index, resolution)
+        if as_frame:
+            return pd.DataFrame(profiles.T, index=index)
+        return profiles
+
+    def get_population_events_from_e_yearly(self, e_yearly_controlled, year=None, resolution=None, rng=None):
+        """Same population as get_population_profile_from_e_yearly with the same rng, kept as sparse DrawOffEvents."""
+        if year is None:
+            year = self.year
+        if resolution is None:
+            resolution = config.get("time", "resolution")
+        if rng is None:
+            rng = np.random.default_rng(seed)
+        return self.generate_population_events(self.get_sampling_index(year, resolution), e_yearly_controlled, rng,
+                                               days_in_year(year))
 
-        return self._create_final_profile(yearly_profile, discrete_water_usage_occurrences, vol_water_used)
+    def get_sampling_index(self, year=None, resolution=None, cache=True):
+        """Returns the draw-off sampling index of the yearly base profile.
+
+        With cache=False the base profile is not kept in the profile cache, see return_yearly_profile."""
+        if year is None:
+            year = self.year
+        if resolution is None:
+            resolution = config.get("time", "resolution")
+        if (year, resolution) not in self._sampling_indices:
+            yearly_profile = self.yearly_dhw.return_yearly_profile(
+                pd.date_range(start=f"{year}-01-01", end=f"{year}-12-31"), resolution, cache=cache)
+            return self._get_sampling_index(yearly_profile, year, resolution)
+        return self._sampling_indices[(year, resolution)]
+
+    def release_sampling_index(self, year=None, resolution=None):
+        """Drops the sampling index of the year and resolution, the next get_sampling_index builds it again."""
+        if year is None:
+            year = self.year
+        if resolution is None:
+            resolution = config.get("time", "resolution")
+        self._sampling_indices.pop((year, resolution), None)
+
+    def sampling_index_keys(self):
+        """The (year, resolution) pairs whose sampling index is kept."""
+        return list(self._sampling_indices)
+
+    @staticmethod
+    def get_population_metadata(e_yearly_controlled, n_days=365):
+        """Returns yearly energy, yearly hot water volume, occupants and discrete profile class per household."""
+        e_yearly_controlled = np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float))
+        valid = ~np.isnan(e_yearly_controlled) & (e_yearly_controlled != 0.)
+        vol_water_used, n_people = IndividualHotWaterProfile.calc_number_of_occupants(
+            np.where(valid, e_yearly_controlled, 0.))
+        profiles = np.array([profile.value for profile in DiscreteProfile])
+        return pd.DataFrame({
+            "e_yearly": e_yearly_controlled,
+            "vol_water_l": vol_water_used,
+            "n_people": n_people,
+            "discrete_profile": np.where(
+                valid, profiles[IndividualHotWaterProfile._get_discrete_water_usage_profiles(vol_water_used, n_days)],
+                ""),
+        })
+
+    @staticmethod
+    @timed("IndividualHotWaterProfile.generate_population")
+    def generate_population(sampling_index, e_yearly_controlled, rng, n_days=365):
+        """Generates the households x timesteps matrix at the resolution of the sampling index.
+
+        n_days is the number of days of the simulated year, it sets the daily volume of the discrete profiles."""
+        vol_water_used, occurrences, volumes = IndividualHotWaterProfile._get_population_draw_offs(
+            e_yearly_controlled, n_days)
+        return IndividualHotWaterProfile._create_final_population_profile(sampling_index, occurrences, volumes,
+                                                                          vol_water_used, rng)
+
+    @staticmethod
+    @timed("IndividualHotWaterProfile.generate_population_events")
+    def generate_population_events(sampling_index, e_yearly_controlled, rng, n_days=365):
+        """Generates the draw-off events of the population on the time steps of the sampling index."""
+        vol_water_used, occurrences, volumes = IndividualHotWaterProfile._get_population_draw_offs(
+            e_yearly_controlled, n_days)
+        household, draw_off_type, time_step, volume = IndividualHotWaterProfile._sample_population_events(
+            sampling_index, occurrences, volumes, rng)
+        total = np.bincount(household, weights=volume, minlength=len(e_yearly_controlled))
+        np.divide(vol_water_used, total, out=total, where=total > 0)
+        return DrawOffEvents.from_events(household, time_step, volume * total[household], draw_off_type,
+                                         len(vol_water_used), sampling_index.index)
+
+    @staticmethod
+    def _get_population_draw_offs(e_yearly_controlled, n_days=365):
+        """Returns the yearly hot water volume and the households x draw-offs occurrence and volume matrices.
+
+        Only these depend on the config (temperatures and loss coefficient); placing the draw-offs does not."""
+        e_yearly_controlled = np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float))
+        valid = ~np.isnan(e_yearly_controlled) & (e_yearly_controlled != 0.)
+        vol_water_used, _ = IndividualHotWaterProfile.calc_number_of_occupants(np.where(valid, e_yearly_controlled, 0.))
+        occurrences, volumes = IndividualHotWaterProfile._get_discrete_water_usage_population(vol_water_used, n_days)
+        occurrences[~valid] = 0
+        return vol_water_used, occurrences, volumes
 
     @staticmethod
-    def _get_discrete_water_usage_profile(vol_water_l):
-        vol_water_l /= 365.
+    def _get_discrete_water_usage_profile(vol_water_l, n_days=365):
+        vol_water_l /= n_days
         if vol_water_l <= _l_per_discrete_profile[DiscreteProfile.LIGHT] * 1.2:
             return DiscreteProfile.LIGHT
         elif vol_water_l <= _l_per_discrete_profile[DiscreteProfile.MEDIUM] * 1.2:
@@ -117,43 +395,123 @@ class IndividualHotWaterProfile:
         else:
             return DiscreteProfile.MULTIPLE_HEAVY
 
-    def _get_discrete_water_usage(self, vol_water_l):
-        profile = IndividualHotWaterProfile._get_discrete_water_usage_profile(vol_water_l)
+    def _get_discrete_water_usage(self, vol_water_l, n_days=365):
+        profile = IndividualHotWaterProfile._get_discrete_water_usage_profile(vol_water_l, n_days)
         if profile == DiscreteProfile.MULTIPLE_HEAVY:
             return multiply_heavy_profile(vol_water_l)
         return draw_off_statistics[profile]
 
-    def _create_final_profile(self, yearly_profile, discrete_water_usage_occurrences, vol_water_used):
+    @staticmethod
+    def _get_discrete_water_usage_profiles(vol_water_l, n_days=365):
+        """Vectorized version of _get_discrete_water_usage_profile, returns positions in list(DiscreteProfile)."""
+        limits = [_l_per_discrete_profile[profile] * 1.2 for profile in
+                  (DiscreteProfile.LIGHT, DiscreteProfile.MEDIUM, DiscreteProfile.HEAVY)]
+        return np.searchsorted(limits, np.asarray(vol_water_l) / n_days, side="left")
+
+    @staticmethod
+    def _get_discrete_water_usage_population(vol_water_l, n_days=365):
+        """Returns the households x draw-offs matrices of yearly draw-off occurrences and draw-off volumes."""
+        profiles = list(DiscreteProfile)
+        statistics = [draw_off_statistics.get(profile, draw_off_statistics[DiscreteProfile.HEAVY]) for profile in profiles]
+        codes = IndividualHotWaterProfile._get_discrete_water_usage_profiles(vol_water_l, n_days)
+        occurrences = np.array([stat.occurrence.values for stat in statistics], dtype=np.int64)[codes]
+        volumes = np.array([stat.volume_l.values for stat in statistics], dtype=float)[codes]
+        multiple_heavy = codes == profiles.index(DiscreteProfile.MULTIPLE_HEAVY)
+        occurrences[multiple_heavy] *= np.ceil(
+            vol_water_l[multiple_heavy] / _l_per_discrete_profile[DiscreteProfile.HEAVY]).astype(np.int64)[:, None]
+        return occurrences, volumes
+
+    @staticmethod
+    def _sample_population_events(sampling_index, occurrences, volumes, rng):
+        """Samples the draw-offs of all households, ordered by household then draw-off type.
+
+        Returns household, draw-off type (position in draw_offs), time step and volume arrays, one entry per event."""
+        n_households, n_draw_offs = occurrences.shape
+        household = np.repeat(np.repeat(np.arange(n_households), n_draw_offs), occurrences.ravel())
+        draw_off_type = np.repeat(np.tile(np.arange(n_draw_offs), n_households), occurrences.ravel())
+        volume = np.repeat(volumes.ravel(), occurrences.ravel())
+        with instrumentation.stage("IndividualHotWaterProfile.sample_draw_offs"):
+            if isinstance(rng, np.random.Generator):
+                time_step = sampling_index.sample(len(household), rng)
+            else:
+                # One stream per household: a household's draw-offs do not depend on the rest of the population
+                time_step = np.concatenate([sampling_index.sample(n_events, household_rng) for n_events, household_rng
+                                            in zip(occurrences.sum(axis=1), rng)] + [np.empty(0, dtype=np.intp)])
+        instrumentation.count("draw_offs_placed", len(household))
+        return household, draw_off_type, time_step, volume
+
+    @staticmethod
+    def _create_final_population_profile(sampling_index, occurrences, volumes, vol_water_used, rng):
+        """Places the draw-offs of all households on the base profile and normalises them to the yearly volume."""
+        n_households, n_steps = occurrences.shape[0], sampling_index.n_steps
+        household, _, time_step, volume = IndividualHotWaterProfile._sample_population_events(
+            sampling_index, occurrences, volumes, rng)
+
+        with instrumentation.stage("IndividualHotWaterProfile.accumulate_draw_offs"):
+            profiles = np.bincount(household * n_steps + time_step, weights=volume,
+                                   minlength=n_households * n_steps).reshape(n_households, n_steps)
+        with instrumentation.stage("IndividualHotWaterProfile.normalise"):
+            total = profiles.sum(axis=1)
+            np.divide(vol_water_used, total, out=total, where=total > 0)
+            profiles *= total[:, None]
+        return profiles
+
+    @staticmethod
+    @timed("IndividualHotWaterProfile.resample")
+    def _resample_population(profiles, index, resolution):
+        """Sums the households x timesteps matrix into the requested resolution."""
+        target = index.floor(resolution)
+        if target.equals(index):
+            return profiles, index
+        starts = np.flatnonzero(np.r_[True, target[1:] != target[:-1]])
+        return np.add.reduceat(profiles, starts, axis=1), target[starts]
+
+    def _create_final_profile(self, yearly_profile, discrete_water_usage_occurrences, vol_water_used,
+                              sampling_index=None, rng=None):
         """Creates the final hot water profile from the yearly profile and usage occurrences."""
-        df = pd.DataFrame(0, index=yearly_profile.index, columns=["Hot water [l/h]"])
-        for draw_off_type, occurrences in discrete_water_usage_occurrences.iterrows():
-            if occurrences.occurrence == 0:
-                continue
-            for i in range(int(occurrences.occurrence)):
-                profile_selector = random.choice(yearly_profile.columns)
-                random_day = random.choice(yearly_profile.index.dayofyear)
-                random_hour = yearly_profile[profile_selector].nlargest(365 * 24).iloc[
-                    random.randint(0, int(len(yearly_profile[profile_selector]) / 2))
-                ]
-                while random_hour == 0:
-                    random_hour = yearly_profile[profile_selector].nlargest(365 * 24).iloc[
-                        random.randint(0, int(len(yearly_profile[profile_selector]) / 2))
-                    ]
-                random_time = random_hour.name
-                df.loc[random_time, "Hot water [l/h]"] += occurrences.volume_l
-
-        df = df.resample(config.get("time", "resolution")).sum()
-        df["Hot water [l/h]"] *= vol_water_used / df["Hot water [l/h]"].sum()
+        if sampling_index is None:
+            sampling_index = DrawOffSamplingIndex(yearly_profile)
+        with instrumentation.stage("IndividualHotWaterProfile.sample_draw_offs"):
+            if rng is not None:
+                # Same order of draws as _sample_population_events: by draw-off type, then occurrence
+                occurrence = discrete_water_usage_occurrences.occurrence.values.astype(np.int64)
+                volume = np.repeat(discrete_water_usage_occurrences.volume_l.values.astype(float), occurrence)
+                hot_water = np.bincount(sampling_index.sample(len(volume), rng), weights=volume,
+                                        minlength=len(yearly_profile))
+            else:
+                hot_water = np.zeros(len(yearly_profile))
+                for draw_off_type, occurrences in discrete_water_usage_occurrences.iterrows():
+                    if occurrences.occurrence == 0:
+                        continue
+                    for i in range(int(occurrences.occurrence)):
+                        hot_water[sampling_index.draw()] += occurrences.volume_l
+        instrumentation.count("draw_offs_placed", int(discrete_water_usage_occurrences.occurrence.sum()))
+
+        with instrumentation.stage("IndividualHotWaterProfile.resample"):
+            df = pd.DataFrame(hot_water, index=yearly_profile.index, columns=["Hot water [l/h]"])
+            df = df.resample(config.get("time", "resolution")).sum()
+        with instrumentation.stage("IndividualHotWaterProfile.normalise"):
+            df["Hot water [l/h]"] *= vol_water_used / df["Hot water [l/h]"].sum()
         return df
 
     @staticmethod
-    def calc_number_of_occupants(e_yearly_controlled):
-        """Calculates the number of occupants based on yearly controlled energy."""
-        yearly_heat_consumption = e_yearly_controlled * IndividualHotWaterProfile.loss_coefficient
+    def calc_number_of_occupants(e_yearly_controlled, hot_water_temp=None, cold_water_temp=None,
+                                 loss_coefficient=None):
+        """Calculates the number of occupants based on yearly controlled energy.
+
+        The temperatures and the loss coefficient default to the configured values."""
+        if hot_water_temp is None:
+            hot_water_temp = IndividualHotWaterProfile.hot_water_temp
+        if cold_water_temp is None:
+            cold_water_temp = IndividualHotWaterProfile.cold_water_temp
+        if loss_coefficient is None:
+            loss_coefficient = IndividualHotWaterProfile.loss_coefficient
+        yearly_heat_consumption = e_yearly_controlled * loss_coefficient
         vol_water_used = e_yearly_controlled / (
-                (IndividualHotWaterProfile.hot_water_temp - IndividualHotWaterProfile.cold_water_temp) *
-                IndividualHotWaterProfile.c * IndividualHotWaterProfile.loss_coefficient)
-        n_people = round(vol_water_used / (IndividualHotWaterProfile.water_consumption_per_person_per_day * 365))
+                (hot_water_temp - cold_water_temp) * IndividualHotWaterProfile.c * loss_coefficient)
+        n_people = np.round(vol_water_used / (IndividualHotWaterProfile.water_consumption_per_person_per_day * 365))
+        # Works on scalars and on arrays of yearly energies alike
+        n_people = int(n_people) if np.ndim(n_people) == 0 else n_people.astype(int)
         return vol_water_used, n_people
 
     @staticmethod
@@ -170,3 +528,22 @@ class IndividualHotWaterProfile:
                 if heater.Volume > vol_water_l:
                     return heater
         return IndividualHotWaterProfile.water_heater_data.get_heater_data(vol_water_l)
+
+    @staticmethod
+    def calc_heater_size_population(n_people, measurement=None):
+        """Vectorized calc_heater_size for a population, measurement is a households x timesteps matrix.
+
+        Returns one row of heater data per household, see WaterHeaterData.get_heater_data_batch."""
+        n_people = np.atleast_1d(np.asarray(n_people))
+        vol_water_l = np.where(n_people == 0, 50, n_people * IndividualHotWaterProfile.water_consumption_per_person_per_day)
+        heaters = IndividualHotWaterProfile.water_heater_data.get_heater_data_batch(vol_water_l)
+        if measurement is None:
+            return heaters
+        measurement = np.asarray(measurement, dtype=float)
+        power = np.where(measurement > 0.2, measurement, -np.inf).max(axis=1)
+        measured = np.isfinite(power)
+        by_power = IndividualHotWaterProfile.water_heater_data.find_heater_by_power_batch(power[measured])
+        use_power = np.zeros(len(n_people), dtype=bool)
+        use_power[measured] = by_power["Volume"].values > vol_water_l[measured]
+        heaters.iloc[np.flatnonzero(use_power)] = by_power[use_power[measured]].values
+        return heaters
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.domestic_hot_water_definitions import draw_offs
+
+
+class DrawOffEvents:
+    """Sparse form of a population of profiles: the list of draw-offs instead of dense timesteps.
+
+    Events are packed in flat arrays ordered by household; the events of household h are
+    [offsets[h], offsets[h + 1]). Every event has a time step of the base resolution (position in a time index of
+    n_steps steps of length step from start), a volume in l (already normalised to the household's yearly volume) and
+    a draw-off type (position in draw_offs). Dense series are only rendered on request, at the base resolution or
+    any coarser one."""
+
+    def __init__(self, offsets, time_step, volume, draw_off_type, start, step, n_steps):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.time_step = np.asarray(time_step, dtype=np.int32)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self.draw_off_type = np.asarray(draw_off_type, dtype=np.uint8)
+        self.start = np.datetime64(start, "ns")
+        self.step = np.timedelta64(pd.Timedelta(step).value, "ns")
+        self.n_steps = int(n_steps)
+
+    @classmethod
+    def from_events(cls, household, time_step, volume, draw_off_type, n_households, index):
+        """Packs per-event arrays (sorted by household) over the time index of the base profile."""
+        offsets = np.zeros(n_households + 1, dtype=np.int64)
+        np.cumsum(np.bincount(household, minlength=n_households), out=offsets[1:])
+        return cls(offsets, time_step, volume, draw_off_type, index[0], index[1] - index[0], len(index))
+
+    @property
+    def n_households(self):
+        return len(self.offsets) - 1
+
+    @property
+    def household(self):
+        """Household position of every event."""
+        return np.repeat(np.arange(self.n_households), np.diff(self.offsets))
+
+    @property
+    def index(self):
+        return pd.date_range(start=self.start, periods=self.n_steps, freq=pd.Timedelta(self.step))
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.offsets, self.time_step, self.volume, self.draw_off_type))
+
+    def _households(self, households):
+        """Events of the selected households as (position in the selection, time step, volume)."""
+        if households is None:
+            return self.household, self.time_step, self.volume, self.n_households
+        households = np.atleast_1d(np.arange(self.n_households)[households])
+        counts = self.offsets[households + 1] - self.offsets[households]
+        events = np.concatenate([np.arange(self.offsets[h], self.offsets[h + 1]) for h in households] +
+                                [np.empty(0, dtype=np.int64)])
+        return np.repeat(np.arange(len(households)), counts), self.time_step[events], self.volume[events], \
+            len(households)
+
+    def _target_steps(self, resolution):
+        """Maps the base time steps onto the steps of a coarser (or the same) resolution."""
+        if resolution is None:
+            return np.arange(self.n_steps), self.index
+        target_step = np.timedelta64(pd.Timedelta(resolution).value, "ns")
+        if target_step < self.step or target_step % self.step != np.timedelta64(0, "ns"):
+            raise ValueError(f"Cannot render events of {pd.Timedelta(self.step)} steps at {resolution}, "
+                             f"the resolution must be a multiple of the base resolution")
+        index = self.index
+        target_index = index.floor(resolution)
+        starts = np.flatnonzero(np.r_[True, target_index[1:] != target_index[:-1]])
+        return np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, self.n_steps])), target_index[starts]
+
+    def to_matrix(self, resolution=None, households=None):
+        """Renders the selected households (all if None) as a households x timesteps matrix in l/h."""
+        target, index = self._target_steps(resolution)
+        household, time_step, volume, n_households = self._households(households)
+        return np.bincount(household * len(index) + target[time_step], weights=volume,
+                           minlength=n_households * len(index)).reshape(n_households, len(index))
+
+    def window_matrix(self, start, stop):
+        """Renders the base time steps [start, stop) of all households, e.g. one month of the year."""
+        in_window = (self.time_step >= start) & (self.time_step < stop)
+        n_steps = stop - start
+        return np.bincount(self.household[in_window] * n_steps + self.time_step[in_window] - start,
+                           weights=self.volume[in_window], minlength=self.n_households * n_steps).reshape(
+            self.n_households, n_steps)
+
+    def to_frame(self, resolution=None, households=None):
+        """Renders the selected households as a DataFrame, one column per household."""
+        _, index = self._target_steps(resolution)
+        columns = np.arange(self.n_households) if households is None else \
+            np.atleast_1d(np.arange(self.n_households)[households])
+        return pd.DataFrame(self.to_matrix(resolution, households).T, index=index, columns=columns)
+
+    def to_series(self, household, resolution=None):
+        """Renders a single household like get_individual_profile_from_e_yearly does."""
+        return self.to_frame(resolution, [household]).iloc[:, 0].rename("Hot water [l/h]")
+
+    def aggregate(self, resolution=None):
+        """Sum of all households without rendering them."""
+        target, index = self._target_steps(resolution)
+        return pd.Series(np.bincount(target[self.time_step], weights=self.volume, minlength=len(index)), index=index)
+
+    def volume_by_draw_off(self):
+        """Yearly volume per household and draw-off type."""
+        totals = np.bincount(self.household * len(draw_offs) + self.draw_off_type, weights=self.volume,
+                             minlength=self.n_households * len(draw_offs))
+        return pd.DataFrame(totals.reshape(self.n_households, len(draw_offs)), columns=draw_offs)
+
+    def save(self, filename):
+        np.savez(filename, offsets=self.offsets, time_step=self.time_step, volume=self.volume,
+                 draw_off_type=self.draw_off_type, start=self.start, step=self.step, n_steps=self.n_steps)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            return cls(data["offsets"], data["time_step"], data["volume"], data["draw_off_type"], data["start"][()],
+                       data["step"][()], int(data["n_steps"]))
@@ -0,0 +1,76 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile
+from domestic_hot_water.profile_cache import household_cache
+from utility.configuration import config
+from utility.definitions import household_key_seed_sequence, seed
+
+# Part of every content address, bump it when the generation changes so older cached households are not reused
+model_version = 1
+
+
+class KeyedHouseholds:
+    """Regenerates or fetches any single household of a population without generating the others.
+
+    A household's profile is a pure function of the root seed, its key, its yearly energy, the year and parameters():
+    its draw-offs come from household_key_seed_sequence(key, root_seed), not from a random state shared with the
+    households before it. Profiles are kept in a content-addressed cache (a ProfileCache, in memory and optionally on
+    disk with LRU eviction, values only) under the sha256 of those inputs, so after a config change or an edit of some energies
+    only the households whose inputs changed are generated again. Integer key i gives row i of
+    get_population_profile_from_e_yearly with rng=household_generators(n, root_seed), up to float rounding."""
+
+    def __init__(self, individual_profile, year=None, root_seed=seed, cache=household_cache):
+        self.individual_profile = individual_profile
+        self.year = individual_profile.year if year is None else year
+        self.root_seed = root_seed
+        self.cache = cache
+
+    def parameters(self):
+        """Settings and inputs the profiles depend on besides key and energy, read from the config on every call."""
+        yearly_dhw = self.individual_profile.yearly_dhw
+        return {"hot_water_temp": IndividualHotWaterProfile.hot_water_temp,
+                "cold_water_temp": IndividualHotWaterProfile.cold_water_temp,
+                "loss_coefficient": IndividualHotWaterProfile.loss_coefficient,
+                "resolution": config.get("time", "resolution"),
+                "holiday_countries": tuple(yearly_dhw.holiday_countries),
+                "input_hash": yearly_dhw._input_hash,
+                "model_version": model_version}
+
+    def digest(self, key, e_yearly_controlled, parameters=None):
+        """Content address of a household: sha256 hex digest of all the inputs of its profile."""
+        if parameters is None:
+            parameters = self.parameters()
+        content = (self.root_seed, repr(key), float(e_yearly_controlled), self.year, sorted(parameters.items()))
+        return hashlib.sha256(repr(content).encode()).hexdigest()
+
+    def profile(self, key, e_yearly_controlled, parameters=None):
+        """Returns the household's profile as get_individual_profile_from_e_yearly does, from the cache if present."""
+        if np.isnan(e_yearly_controlled) or e_yearly_controlled == 0.:
+            return None
+        if self.cache is None:
+            return self._generate(key, e_yearly_controlled)
+        # Only the values are cached, the time index is the same for every household
+        values = self.cache.get_or_create(("household", self.digest(key, e_yearly_controlled, parameters)),
+                                          lambda: self._generate(key, e_yearly_controlled)["Hot water [l/h]"].values)
+        return pd.DataFrame(values, index=self.individual_profile.get_sampling_index(self.year).index,
+                            columns=["Hot water [l/h]"])
+
+    def profiles(self, e_yearly_by_key):
+        """Returns a DataFrame with one column per key of a {key: yearly energy} mapping, zero or NaN ones left out."""
+        parameters = self.parameters()
+        profiles = {key: self.profile(key, e_yearly_controlled, parameters)
+                    for key, e_yearly_controlled in e_yearly_by_key.items()}
+        return pd.DataFrame({key: profile["Hot water [l/h]"] for key, profile in profiles.items()
+                             if profile is not None})
+
+    def invalidate(self, key, e_yearly_controlled):
+        """Drops the household from the cache, its next profile() generates it again."""
+        if self.cache is not None:
+            self.cache.invalidate(("household", self.digest(key, e_yearly_controlled)))
+
+    def _generate(self, key, e_yearly_controlled):
+        rng = np.random.default_rng(household_key_seed_sequence(key, self.root_seed))
+        return self.individual_profile.get_individual_profile_from_e_yearly(e_yearly_controlled, self.year, rng)
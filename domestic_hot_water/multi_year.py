@@ -0,0 +1,39 @@
+import numpy as np
+
+from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile, days_in_year
+from utility.configuration import config
+from utility.definitions import seed, household_generators
+
+periods = ["year", "month"]
+
+
+def iter_multi_year_population(individual_profile, e_yearly_controlled, start_year, n_years, resolution=None,
+                               period="year", root_seed=seed):
+    """Yields (time index, households x timesteps matrix in l/h) for n_years years from start_year, one year or one
+    month at a time.
+
+    e_yearly_controlled is either one yearly energy per household, used every year, or a years x households array.
+    Every household draws from one stream spawned from root_seed for the whole horizon, so a year continues where
+    the previous one stopped. Each year is sampled as sparse DrawOffEvents and rendered period by period, with its
+    own number of days and holiday calendar. Its base profile is built outside the profile cache and dropped with its
+    sampling index once the year is sampled: memory is bounded by one year of events and one period of profiles,
+    whatever the horizon."""
+    if resolution is None:
+        resolution = config.get("time", "resolution")
+    if period not in periods:
+        raise ValueError(f"Unknown period {period}, use one of {periods}")
+    e_yearly_controlled = np.atleast_2d(np.asarray(e_yearly_controlled, dtype=float))
+    e_yearly_controlled = np.broadcast_to(e_yearly_controlled, (n_years, e_yearly_controlled.shape[1]))
+    rngs = household_generators(e_yearly_controlled.shape[1], root_seed)
+
+    for year, e_yearly in zip(range(start_year, start_year + n_years), e_yearly_controlled):
+        events = IndividualHotWaterProfile.generate_population_events(
+            individual_profile.get_sampling_index(year, resolution, cache=False), e_yearly, rngs, days_in_year(year))
+        individual_profile.release_sampling_index(year, resolution)
+        index = events.index
+        if period == "year":
+            yield index, events.to_matrix()
+            continue
+        starts = np.flatnonzero(np.r_[True, index.month[1:] != index.month[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(index)]):
+            yield index[start:stop], events.window_matrix(start, stop)
@@ -0,0 +1,207 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from domestic_hot_water.domestic_hot_water_profile import DrawOffSamplingIndex, IndividualHotWaterProfile, days_in_year
+from utility.configuration import config
+from utility.definitions import seed, household_seed_sequences
+from utility.instrumentation import instrumentation
+
+
+class SharedArray:
+    """A numpy array in a named shared memory block, created by the parent and attached to by the workers."""
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self._owner = name is None
+        self._shm = SharedMemory(create=True, size=size) if self._owner else SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @classmethod
+    def from_array(cls, array):
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @property
+    def descriptor(self):
+        """What a worker needs to attach: (name, shape, dtype)."""
+        return self._shm.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, descriptor):
+        name, shape, dtype = descriptor
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        del self.array
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+_worker_state = {}
+
+
+def _init_worker(order, n_candidates, output, instrumented=False, trace_memory=False):
+    """Attaches the shared sampling index and output matrix once per worker process.
+
+    instrumented enables the worker's instrumentation, as it is in the parent."""
+    if instrumented:
+        instrumentation.enable(trace_memory)
+    shared = {key: SharedArray.attach(descriptor) for key, descriptor in
+              (("order", order), ("n_candidates", n_candidates), ("output", output))}
+    _worker_state["shared"] = shared
+    _worker_state["sampling_index"] = DrawOffSamplingIndex.from_arrays(shared["order"].array,
+                                                                       shared["n_candidates"].array)
+    _worker_state["output"] = shared["output"].array
+
+
+def _generate_chunk(start, vol_water_used, occurrences, volumes, seed_sequences):
+    """Places the draw-offs of the households [start, start + len(vol_water_used)) into the shared output matrix.
+
+    Volumes and draw-off occurrences come from the parent: workers never read the config, which they would not
+    share with the parent under the spawn and forkserver start methods. Returns the stages and counters the chunk
+    recorded, empty unless the worker is instrumented."""
+    instrumentation.reset()
+    rngs = [np.random.default_rng(seed_sequence) for seed_sequence in seed_sequences]
+    _worker_state["output"][start:start + len(vol_water_used)] = \
+        IndividualHotWaterProfile._create_final_population_profile(_worker_state["sampling_index"], occurrences,
+                                                                   volumes, vol_water_used, rngs)
+    return instrumentation.stages, instrumentation.counters
+
+
+class _PopulationPool:
+    """Process pool placing the draw-offs of households on one sampling index, kept open across many calls.
+
+    The sampling index and an output matrix of max_households rows are put in shared memory once; every generate()
+    fills the first rows of the output in tasks of chunk_size households and returns a copy of them."""
+
+    def __init__(self, sampling_index, max_households, workers, chunk_size=1000, start_method=None):
+        self.chunk_size = chunk_size
+        self._shared = [SharedArray.from_array(sampling_index.order),
+                        SharedArray.from_array(sampling_index.n_candidates),
+                        SharedArray((max_households, sampling_index.n_steps), np.float64)]
+        self._output = self._shared[2].array
+        try:
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                                             initializer=_init_worker,
+                                             initargs=tuple(shared.descriptor for shared in self._shared) + (
+                                                 instrumentation.enabled, instrumentation.trace_memory))
+        except Exception:
+            self._close_shared()
+            raise
+
+    def generate(self, vol_water_used, occurrences, volumes, seed_sequences):
+        """Returns the households x timesteps matrix of the households, see _generate_chunk.
+
+        The stages and counters of the workers are merged into the parent's instrumentation, stage times add up the
+        time spent in all workers."""
+        futures = [self._pool.submit(_generate_chunk, start, vol_water_used[start:start + self.chunk_size],
+                                     occurrences[start:start + self.chunk_size],
+                                     volumes[start:start + self.chunk_size],
+                                     seed_sequences[start:start + self.chunk_size])
+                   for start in range(0, len(vol_water_used), self.chunk_size)]
+        for future in futures:
+            instrumentation.merge(*future.result())
+        return self._output[:len(vol_water_used)].copy()
+
+    def _close_shared(self):
+        self._output = None
+        for shared in self._shared:
+            shared.close()
+
+    def close(self):
+        self._pool.shutdown()
+        self._close_shared()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _parallel_settings(workers, chunk_size, start_method):
+    if workers is None:
+        workers = config.getint("parallel", "workers", fallback=1)
+    if chunk_size is None:
+        chunk_size = config.getint("parallel", "chunk_size", fallback=1000)
+    if start_method is None and config.has_option("parallel", "start_method"):
+        start_method = config.get("parallel", "start_method")
+    return workers, chunk_size, start_method
+
+
+def generate_population_parallel(individual_profile, e_yearly_controlled, year=None, resolution=None, root_seed=seed,
+                                 workers=None, chunk_size=None, seed_sequences=None, start_method=None):
+    """Generates a population of profiles in a process pool, see get_population_profile_from_e_yearly.
+
+    Household i draws from the i-th child of SeedSequence(root_seed), so the result is bit-identical for a given
+    seed whatever the number of workers and the chunk size. The sampling index of the base profile and the output
+    matrix live in shared memory, only the households' volumes, draw-off counts and seeds are sent to the workers.
+    seed_sequences overrides the streams spawned from root_seed. start_method is the multiprocessing start method of
+    the pool (fork, spawn or forkserver), by default parallel.start_method from the config or else the platform's
+    default."""
+    if year is None:
+        year = individual_profile.year
+    if resolution is None:
+        resolution = config.get("time", "resolution")
+    workers, chunk_size, start_method = _parallel_settings(workers, chunk_size, start_method)
+    e_yearly_controlled = np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float))
+    if seed_sequences is None:
+        seed_sequences = household_seed_sequences(len(e_yearly_controlled), root_seed)
+    sampling_index = individual_profile.get_sampling_index(year, resolution)
+
+    if workers <= 1:
+        profiles = IndividualHotWaterProfile.generate_population(
+            sampling_index, e_yearly_controlled, [np.random.default_rng(s) for s in seed_sequences],
+            days_in_year(year))
+        return IndividualHotWaterProfile._resample_population(profiles, sampling_index.index, resolution)[0]
+
+    vol_water_used, occurrences, volumes = IndividualHotWaterProfile._get_population_draw_offs(
+        e_yearly_controlled, days_in_year(year))
+    with _PopulationPool(sampling_index, len(e_yearly_controlled), workers, chunk_size, start_method) as pool:
+        profiles = pool.generate(vol_water_used, occurrences, volumes, seed_sequences)
+    return IndividualHotWaterProfile._resample_population(profiles, sampling_index.index, resolution)[0]
+
+
+def iter_population_chunks(individual_profile, e_yearly_controlled, year=None, resolution=None, root_seed=seed,
+                           chunk_size=None, workers=None, start_method=None):
+    """Yields (start, households x timesteps matrix) for consecutive chunks of the population.
+
+    Only one chunk is held in memory at a time; the streams are the same as for generating the whole population at
+    once, so the concatenated chunks equal generate_population_parallel whatever the chunk size. With more than one
+    worker, a single process pool and shared sampling index serve all the chunks."""
+    if year is None:
+        year = individual_profile.year
+    if resolution is None:
+        resolution = config.get("time", "resolution")
+    if chunk_size is None:
+        chunk_size = config.getint("output", "chunk_size", fallback=1000)
+    workers, task_size, start_method = _parallel_settings(workers, None, start_method)
+    e_yearly_controlled = np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float))
+    seed_sequences = household_seed_sequences(len(e_yearly_controlled), root_seed)
+    sampling_index = individual_profile.get_sampling_index(year, resolution)
+    vol_water_used, occurrences, volumes = IndividualHotWaterProfile._get_population_draw_offs(
+        e_yearly_controlled, days_in_year(year))
+
+    if workers <= 1:
+        for start in range(0, len(e_yearly_controlled), chunk_size):
+            stop = start + chunk_size
+            profiles = IndividualHotWaterProfile._create_final_population_profile(
+                sampling_index, occurrences[start:stop], volumes[start:stop], vol_water_used[start:stop],
+                [np.random.default_rng(s) for s in seed_sequences[start:stop]])
+            yield start, IndividualHotWaterProfile._resample_population(profiles, sampling_index.index, resolution)[0]
+        return
+
+    with _PopulationPool(sampling_index, max(min(chunk_size, len(e_yearly_controlled)), 1), workers, task_size,
+                         start_method) as pool:
+        for start in range(0, len(e_yearly_controlled), chunk_size):
+            stop = start + chunk_size
+            profiles = pool.generate(vol_water_used[start:stop], occurrences[start:stop], volumes[start:stop],
+                                     seed_sequences[start:stop])
+            yield start, IndividualHotWaterProfile._resample_population(profiles, sampling_index.index, resolution)[0]
@@ -0,0 +1,284 @@
+import hashlib
+import time
+from collections import OrderedDict
+from os import fdopen, listdir, makedirs, remove, replace, stat, utime
+from os.path import basename, dirname, getsize, join
+from tempfile import mkstemp
+
+import numpy as np
+import pandas as pd
+
+from utility.configuration import config
+from utility.instrumentation import instrumentation
+
+_file_hashes = {}
+
+
+def file_content_hash(filename):
+    """Returns the sha256 hex digest of a file's content, memoized on the file's modification time and size."""
+    file_stat = stat(filename)
+    memo_key = (filename, file_stat.st_mtime_ns, file_stat.st_size)
+    if memo_key not in _file_hashes:
+        with open(filename, "rb") as f:
+            _file_hashes[memo_key] = hashlib.sha256(f.read()).hexdigest()
+    return _file_hashes[memo_key]
+
+
+class ProfileCache:
+    """Two-tier cache for DataFrames and arrays derived from the DHW input files.
+
+    The first tier is an in-process LRU holding at most max_entries values and max_memory_bytes bytes. The optional
+    second tier stores every value as an .npz file in directory, so repeated runs and worker processes skip the build
+    entirely; it is evicted least recently used first once it grows beyond max_disk_bytes. Its file sizes and order of
+    use are tracked in memory, the directory is only listed again when it is evicted. Keys are tuples of strings and
+    numbers."""
+
+    def __init__(self, max_entries=32, directory=None, max_disk_bytes=256 * 1024 ** 2,
+                 max_memory_bytes=1024 * 1024 ** 2):
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._configure(max_entries, directory, max_disk_bytes, max_memory_bytes)
+
+    def _configure(self, max_entries, directory, max_disk_bytes, max_memory_bytes):
+        """Sets the limits and the directory, the values in memory are kept as far as the limits allow."""
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._disk_sizes = None
+        self._disk_bytes = 0
+        if directory is not None:
+            makedirs(directory, exist_ok=True)
+        self._trim_memory()
+
+    def _ensure_configured(self):
+        """Called before every use, for subclasses whose settings come from elsewhere."""
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    def _disk_file(self, key):
+        return join(self.directory, f"{self._digest(key)}.npz")
+
+    def get(self, key):
+        """Returns a copy of the cached value, or None if the key is in neither tier."""
+        self._ensure_configured()
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            instrumentation.count("profile_cache.memory_hits")
+            return self._memory[key].copy()
+        if self.directory is not None:
+            filename = self._disk_file(key)
+            try:
+                df = self._load(filename)
+                utime(filename)
+            except FileNotFoundError:
+                # Not written yet, or evicted meanwhile by another process sharing the directory
+                df = None
+            if df is not None:
+                self._use_disk_file(filename)
+                self._put_memory(key, df)
+                self.hits += 1
+                instrumentation.count("profile_cache.disk_hits")
+                return df.copy()
+        self.misses += 1
+        instrumentation.count("profile_cache.misses")
+        return None
+
+    def put(self, key, df):
+        """Stores the value, a DataFrame or an array, in both tiers."""
+        self._ensure_configured()
+        self._put_memory(key, df.copy())
+        if self.directory is not None:
+            filename = self._disk_file(key)
+            self._save(filename, df)
+            self._use_disk_file(filename)
+
+    def get_or_create(self, key, factory):
+        """Returns the cached value, building and storing it with factory() on a miss."""
+        df = self.get(key)
+        if df is None:
+            df = factory()
+            self.put(key, df)
+        return df
+
+    def invalidate(self, key=None):
+        """Drops one key, or everything if key is None, from both tiers."""
+        self._ensure_configured()
+        if key is not None:
+            if key in self._memory:
+                self._memory_bytes -= self._nbytes(self._memory.pop(key))
+            if self.directory is not None:
+                filename = self._disk_file(key)
+                self._remove(filename)
+                if self._disk_sizes is not None:
+                    self._disk_bytes -= self._disk_sizes.pop(filename, 0)
+            return
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.directory is not None:
+            for filename in self._disk_files():
+                self._remove(filename)
+            self._remove_stale_temporary_files()
+            self._disk_sizes = None
+
+    @staticmethod
+    def _nbytes(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        return int(value.memory_usage(index=True).sum())
+
+    def _put_memory(self, key, df):
+        if key in self._memory:
+            self._memory_bytes -= self._nbytes(self._memory[key])
+        self._memory[key] = df
+        self._memory.move_to_end(key)
+        self._memory_bytes += self._nbytes(df)
+        self._trim_memory()
+
+    def _trim_memory(self):
+        while len(self._memory) > self.max_entries or (len(self._memory) > 1 and
+                                                       self._memory_bytes > self.max_memory_bytes):
+            self._memory_bytes -= self._nbytes(self._memory.popitem(last=False)[1])
+
+    def _disk_files(self, extension=".npz"):
+        return [join(self.directory, f) for f in listdir(self.directory) if f.endswith(extension)]
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            remove(filename)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _size(filename):
+        """Size of the file, None if another process removed it."""
+        try:
+            return getsize(filename)
+        except FileNotFoundError:
+            return None
+
+    def _remove_stale_temporary_files(self):
+        """Removes the temporary files of writes that were interrupted more than an hour ago."""
+        for filename in self._disk_files(".tmp"):
+            try:
+                if stat(filename).st_mtime < time.time() - 3600:
+                    remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def _disk_usage(self, rank=None):
+        """Size of every file of the disk tier, least recently used first, read from the directory if not known.
+
+        Files are ordered by modification time, files with the same one (it is coarse on some file systems) by rank."""
+        if self._disk_sizes is None:
+            rank = rank or {}
+            files = []
+            for filename in self._disk_files():
+                try:
+                    file_stat = stat(filename)
+                except FileNotFoundError:
+                    continue
+                files.append((file_stat.st_mtime_ns, rank.get(filename, -1), filename, file_stat.st_size))
+            self._disk_sizes = OrderedDict((filename, size) for _, _, filename, size in sorted(files))
+            self._disk_bytes = sum(self._disk_sizes.values())
+        return self._disk_sizes
+
+    def _use_disk_file(self, filename):
+        sizes = self._disk_usage()
+        size = sizes.get(filename) or self._size(filename)
+        if size is None:
+            return
+        self._disk_bytes += size - sizes.pop(filename, 0)
+        sizes[filename] = size
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        # Other processes may write to the same directory, so list it again, and evict down to 90% of the limit so
+        # that the next puts do not list it again right away
+        rank = {filename: i for i, filename in enumerate(self._disk_sizes)}
+        self._disk_sizes = None
+        sizes = self._disk_usage(rank)
+        while sizes and self._disk_bytes > 0.9 * self.max_disk_bytes:
+            oldest, size = sizes.popitem(last=False)
+            self._disk_bytes -= size
+            self._remove(oldest)
+        self._remove_stale_temporary_files()
+
+    @staticmethod
+    def _save(filename, df):
+        if isinstance(df, np.ndarray):
+            arrays = {"values": df}
+        else:
+            arrays = {"values": df.values, "columns": np.array(df.columns.tolist(), dtype=str),
+                      "index": df.index.values}
+            if isinstance(df.index, pd.DatetimeIndex):
+                arrays["freq"] = np.array(df.index.freqstr or "")
+        # Write to a temporary file of this writer first, so concurrent readers never see a partial file and
+        # concurrent writers of the same key do not write into each other's file
+        descriptor, temporary_filename = mkstemp(dir=dirname(filename), prefix=f"{basename(filename)}.", suffix=".tmp")
+        try:
+            with fdopen(descriptor, "wb") as f:
+                np.savez(f, **arrays)
+        except BaseException:
+            ProfileCache._remove(temporary_filename)
+            raise
+        try:
+            replace(temporary_filename, filename)
+        except OSError:
+            # Another process published the same key (e.g. it is open for reading on Windows), or removed the
+            # temporary file as stale; the content of a key is the same whoever writes it
+            ProfileCache._remove(temporary_filename)
+
+    @staticmethod
+    def _load(filename):
+        with np.load(filename, allow_pickle=False) as data:
+            if "columns" not in data:
+                return data["values"]
+            columns = data["columns"]
+            columns = pd.MultiIndex.from_arrays(columns.T) if columns.ndim == 2 else pd.Index(columns)
+            index = pd.Index(data["index"])
+            if "freq" in data and str(data["freq"]):
+                index = pd.DatetimeIndex(index, freq=str(data["freq"]))
+            return pd.DataFrame(data["values"], index=index, columns=columns)
+
+
+class _ConfiguredProfileCache(ProfileCache):
+    """A cache configured from a config section, of the active config unless configuration is given, on first use and
+    again whenever that config is loaded from a file."""
+
+    def __init__(self, section="cache", max_entries=32, max_disk_mb=256, max_memory_mb=1024, configuration=None):
+        ProfileCache.__init__(self, max_entries, max_disk_bytes=max_disk_mb * 1024 ** 2,
+                              max_memory_bytes=max_memory_mb * 1024 ** 2)
+        self._section = section
+        self._defaults = (max_entries, max_disk_mb, max_memory_mb)
+        self._configuration = configuration
+        self._configured_from = (None, None)
+
+    def with_configuration(self, configuration):
+        """A new, empty cache of the same section and defaults, configured from configuration."""
+        return _ConfiguredProfileCache(self._section, *self._defaults, configuration=configuration)
+
+    def _ensure_configured(self):
+        configuration = config.active if self._configuration is None else self._configuration
+        configured_from, generation = self._configured_from
+        if configured_from is configuration and generation == configuration.generation:
+            return
+        section, (max_entries, max_disk_mb, max_memory_mb) = self._section, self._defaults
+        directory = configuration.get(section, "directory") if configuration.has_option(section, "directory") \
+            else None
+        self._configure(configuration.getint(section, "max_entries", fallback=max_entries), directory,
+                        configuration.getint(section, "max_disk_mb", fallback=max_disk_mb) * 1024 ** 2,
+                        configuration.getint(section, "max_memory_mb", fallback=max_memory_mb) * 1024 ** 2)
+        self._configured_from = (configuration, configuration.generation)
+
+
+profile_cache = _ConfiguredProfileCache()
+# Content-addressed household profiles of keyed_households.py, see [household_cache] in config.ini
+household_cache = _ConfiguredProfileCache("household_cache", max_entries=4096, max_disk_mb=1024, max_memory_mb=512)
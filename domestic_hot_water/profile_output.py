@@ -0,0 +1,231 @@
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile, days_in_year
+from domestic_hot_water.parallel_generation import iter_population_chunks
+from utility.configuration import config
+from utility.definitions import seed
+from utility.instrumentation import instrumentation
+
+output_formats = ["csv", "hdf5", "parquet", "memmap", "aggregate"]
+
+
+class ProfileWriter:
+    """Writes a population of profiles chunk by chunk, all sharing one time index."""
+
+    def __init__(self, index, year, resolution):
+        self.index = index
+        self.year = year
+        self.resolution = resolution
+        self.n_households = 0
+
+    def write(self, metadata, profiles):
+        """Writes a households x timesteps chunk and its metadata (see get_population_metadata)."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CsvProfileWriter(ProfileWriter):
+    """Compatibility writer: one CSV per household and a combined CSV, which needs every profile in memory.
+
+    Households without hot water get no file. After close, combined is the DataFrame of the combined CSV (None if
+    no household has hot water) and filenames lists the files written."""
+
+    def __init__(self, output_directory, index, year, resolution):
+        super().__init__(index, year, resolution)
+        self.output_directory = output_directory
+        self.profiles = {}
+        self.filenames = []
+        self.combined = None
+
+    def write(self, metadata, profiles):
+        for (_, household), profile in zip(metadata.iterrows(), profiles):
+            self.n_households += 1
+            if household.discrete_profile == "":
+                continue
+            key = f"{int(household.e_yearly)}kWh"
+            self.profiles[key] = pd.Series(profile, index=self.index, name="Hot water [l/h]")
+            single_profile_file = join(self.output_directory, f"dhw_profile_{self.year}_{key}.csv")
+            self.profiles[key].to_frame().to_csv(single_profile_file)
+            self.filenames.append(single_profile_file)
+            print(f"DHW profile written to: {single_profile_file}")
+
+    def close(self):
+        if not self.profiles:
+            return
+        combined_file = join(self.output_directory, f"dhw_profiles_{self.year}_combined.csv")
+        self.combined = pd.concat(self.profiles, axis="columns")
+        self.combined.to_csv(combined_file)
+        self.filenames.append(combined_file)
+        print(f"Combined DHW profiles written to: {combined_file}")
+
+
+class Hdf5ProfileWriter(ProfileWriter):
+    """Appends chunks to an HDF5 file.
+
+    Layout: "time" (datetime64[ns] as int64), "profiles" (households x timesteps, one HDF5 chunk per household) and
+    one dataset per metadata column under "households", whose "columns" attribute keeps their order; year and
+    resolution are file attributes."""
+
+    def __init__(self, filename, index, year, resolution, dtype=np.float64):
+        super().__init__(index, year, resolution)
+        import h5py
+        self.string_dtype = h5py.string_dtype()
+        self.filename = filename
+        self.file = h5py.File(filename, "w")
+        self.file.attrs["year"] = year
+        self.file.attrs["resolution"] = resolution
+        self.file.create_dataset("time", data=index.values.astype("datetime64[ns]").astype(np.int64))
+        self.profiles = self.file.create_dataset("profiles", shape=(0, len(index)), maxshape=(None, len(index)),
+                                                 dtype=dtype, chunks=(1, len(index)), compression="gzip")
+        self.households = self.file.create_group("households")
+
+    def write(self, metadata, profiles):
+        start, stop = self.n_households, self.n_households + len(profiles)
+        if start == 0:
+            self.households.attrs["columns"] = list(metadata.columns)
+        self.profiles.resize(stop, axis=0)
+        self.profiles[start:stop] = profiles
+        for column, values in metadata.items():
+            is_string = values.dtype.kind in "OUS"
+            values = values.values.astype(object if is_string else values.dtype)
+            if column not in self.households:
+                self.households.create_dataset(column, data=values, maxshape=(None,), chunks=True,
+                                               dtype=self.string_dtype if is_string else values.dtype)
+            else:
+                self.households[column].resize(stop, axis=0)
+                self.households[column][start:stop] = values
+        self.n_households = stop
+
+    def close(self):
+        self.file.close()
+        print(f"{self.n_households} DHW profiles written to: {self.filename}")
+
+
+class ParquetProfileWriter(ProfileWriter):
+    """Writes one Parquet row group per chunk, one row per household with its metadata and a fixed size "profile"
+    list; the time index is stored as start, freq and periods in the schema metadata."""
+
+    def __init__(self, filename, index, year, resolution, dtype=np.float64):
+        super().__init__(index, year, resolution)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow, install it or use hdf5 output instead")
+        self.pa = pa
+        self.pq = pq
+        self.filename = filename
+        self.dtype = dtype
+        self.metadata = {"start": str(index[0]), "freq": pd.infer_freq(index) or resolution,
+                         "periods": str(len(index)), "year": str(year), "resolution": resolution}
+        self.writer = None
+
+    def write(self, metadata, profiles):
+        table = self.pa.Table.from_pandas(metadata, preserve_index=False)
+        profile = self.pa.FixedSizeListArray.from_arrays(
+            self.pa.array(np.ascontiguousarray(profiles, dtype=self.dtype).ravel()), len(self.index))
+        table = table.append_column("profile", profile).replace_schema_metadata(self.metadata)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.filename, table.schema)
+        self.writer.write_table(table)
+        self.n_households += len(profiles)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        print(f"{self.n_households} DHW profiles written to: {self.filename}")
+
+
+def create_writer(output_format, output_directory, index, year, resolution):
+    """Creates the writer of the given format (see output_formats) in output_directory."""
+    if output_format == "csv":
+        return CsvProfileWriter(output_directory, index, year, resolution)
+    if output_format == "hdf5":
+        return Hdf5ProfileWriter(join(output_directory, f"dhw_profiles_{year}.h5"), index, year, resolution)
+    if output_format == "parquet":
+        return ParquetProfileWriter(join(output_directory, f"dhw_profiles_{year}.parquet"), index, year, resolution)
+    if output_format == "memmap":
+        from domestic_hot_water.profile_store import MemmapProfileWriter
+        return MemmapProfileWriter(join(output_directory, f"dhw_profiles_{year}.dat"), index, year, resolution,
+                                   dtype=config.get("output", "store_dtype", fallback="float32"),
+                                   scale=config.getfloat("output", "store_scale", fallback=0.01))
+    if output_format == "aggregate":
+        from domestic_hot_water.aggregate import FeederAggregator
+        return FeederAggregator(index, year, resolution,
+                                percentiles=config.getarray("output", "percentiles", dtype=float, fallback="5,50,95"),
+                                filename=join(output_directory, f"dhw_aggregate_{year}.csv"))
+    raise ValueError(f"Unknown output format {output_format}, use one of {output_formats}")
+
+
+def write_population(individual_profile, e_yearly_controlled, writer, year=None, resolution=None, root_seed=seed,
+                     chunk_size=None, workers=None):
+    """Generates the population chunk by chunk and streams every chunk to the writer."""
+    if year is None:
+        year = individual_profile.year
+    e_yearly_controlled = np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float))
+    metadata = IndividualHotWaterProfile.get_population_metadata(e_yearly_controlled, days_in_year(year))
+    for start, profiles in iter_population_chunks(individual_profile, e_yearly_controlled, year, resolution,
+                                                  root_seed, chunk_size, workers):
+        with instrumentation.stage("ProfileWriter.write"):
+            writer.write(metadata.iloc[start:start + len(profiles)], profiles)
+
+
+def write_legacy_population(individual_profile, e_yearly_controlled, writer, year=None):
+    """Generates the households one after another from the random module, as get_individual_profile_from_e_yearly
+    without rng does, and writes each of them to the writer; households without hot water get an all-zero row."""
+    if year is None:
+        year = individual_profile.year
+    e_yearly_controlled = np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float))
+    metadata = IndividualHotWaterProfile.get_population_metadata(e_yearly_controlled, days_in_year(year))
+    for i, e_yearly in enumerate(e_yearly_controlled):
+        profile = individual_profile.get_individual_profile_from_e_yearly(e_yearly, year)
+        profile = np.zeros(len(writer.index)) if profile is None else profile["Hot water [l/h]"].to_numpy()
+        with instrumentation.stage("ProfileWriter.write"):
+            writer.write(metadata.iloc[i:i + 1], profile[np.newaxis])
+
+
+def read_hdf5_profiles(filename, households=None):
+    """Reads the profiles of the given household positions (all if None) and the metadata from an HDF5 output.
+
+    The households are returned in the order they are given, repeated positions included."""
+    import h5py
+    with h5py.File(filename, "r") as f:
+        if households is None:
+            selection, order = slice(None), slice(None)
+        else:
+            # h5py only reads increasing, unique positions: read those, then put them back in the requested order
+            selection, order = np.unique(np.asarray(households), return_inverse=True)
+        index = pd.DatetimeIndex(f["time"][:].astype("datetime64[ns]"))
+        households = f["households"]
+        # Files written before the "columns" attribute list their columns in HDF5's alphabetical order
+        columns = [str(column) for column in households.attrs.get("columns", list(households))]
+        metadata = pd.DataFrame({column: (households[column].asstr() if households[column].dtype.kind == "O" else
+                                          households[column])[selection][order] for column in columns})
+        return pd.DataFrame(f["profiles"][selection][order].T, index=index), metadata
+
+
+def read_parquet_profiles(filename, households=None):
+    """Reads the profiles of the given household positions (all if None) and the metadata from a Parquet output.
+
+    The households are returned in the order they are given, repeated positions included."""
+    import pyarrow.parquet as pq
+    table = pq.read_table(filename)
+    if households is not None:
+        table = table.take(np.asarray(households))
+    schema_metadata = {key.decode(): value.decode() for key, value in table.schema.metadata.items()}
+    index = pd.date_range(start=schema_metadata["start"], periods=int(schema_metadata["periods"]),
+                          freq=schema_metadata["freq"])
+    profiles = table.column("profile").combine_chunks()
+    profiles = profiles.values.to_numpy().reshape(len(table), len(index))
+    return pd.DataFrame(profiles.T, index=index), table.drop(["profile"]).to_pandas()
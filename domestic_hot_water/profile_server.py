@@ -0,0 +1,330 @@
+"""Local profile server: keeps the inputs and base profiles in memory and answers population requests over HTTP.
+
+    python -m domestic_hot_water.profile_server --config config/config.ini [--host HOST] [--port PORT]
+
+POST /population with a JSON body {"e_yearly": [...], "year": 2021, "resolution": "1h", "seed": 0,
+"dtype": "float32"} answers the households x timesteps matrix in l/h as raw little-endian bytes; its shape, dtype and
+time index are in the X-Shape, X-Dtype, X-Index-Start and X-Index-Freq headers; year must be in supported_years.
+GET /health answers a JSON status. The sampling indices of the max_warm_profiles most recently used years and
+resolutions are kept, older ones are released.
+ProfileClient wraps both. The server only listens on the loopback interface by default. Invalid requests are answered
+with 400, other failures with 500, both with a JSON {"error": ...} body."""
+import argparse
+import json
+import queue
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import getcwd
+from os.path import join
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile, days_in_year
+from domestic_hot_water.session import Session
+from domestic_hot_water.sub_hourly import supported_resolutions
+from utility.definitions import household_seed_sequences
+from utility.instrumentation import instrumentation
+
+response_dtypes = ["float32", "float64"]
+supported_years = range(1900, 2201)
+
+
+def _validated_e_yearly(e_yearly, max_households):
+    """The yearly energies of a request as a float array, null for NaN; raises ValueError unless there are 1 to
+    max_households of them, all finite and not negative."""
+    if not isinstance(e_yearly, list) or not 0 < len(e_yearly) <= max_households:
+        raise ValueError(f"e_yearly must be a list of 1 to {max_households} yearly energies")
+    e_yearly = np.array([np.nan if e is None else e for e in e_yearly], dtype=float)
+    if np.any(np.isinf(e_yearly) | (e_yearly < 0)):
+        raise ValueError("e_yearly must be finite and not negative, null for a household without hot water")
+    return e_yearly
+
+
+def _validated_year(year, default):
+    """The year of a request, default if it is null; raises ValueError unless it is in supported_years."""
+    year = default if year is None else int(year)
+    if year not in supported_years:
+        raise ValueError(f"year must be in {supported_years.start} to {supported_years.stop - 1}")
+    return year
+
+
+class _PendingRequest:
+    def __init__(self, e_yearly_controlled, year, resolution, root_seed):
+        self.e_yearly_controlled = e_yearly_controlled
+        self.key = (year, resolution)
+        self.root_seed = root_seed
+        self.done = threading.Event()
+        self.profiles = None
+        self.index = None
+        self.error = None
+
+
+class PopulationBatcher:
+    """Coalesces concurrent population requests into one generation per year and resolution.
+
+    Requests are collected for batch_window seconds after the first one arrives (at most max_households households),
+    then every group of the same year and resolution is generated at once. Household i of a request draws from the
+    i-th stream spawned from the request's seed, so a request gets the same profiles whether it was batched or not.
+    If a group fails, its requests are generated again one by one, so a bad request only fails itself. The sampling
+    indices of the max_warm_profiles most recently used years and resolutions stay warm, see sampling_index."""
+
+    def __init__(self, session, batch_window=0.005, max_households=100000, max_warm_profiles=4):
+        self.session = session
+        self.batch_window = batch_window
+        self.max_households = max_households
+        self.max_warm_profiles = max_warm_profiles
+        self._warm = OrderedDict()
+        self._warm_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def generate(self, e_yearly_controlled, year, resolution, root_seed):
+        """Queues a request and waits for its households x timesteps matrix and time index."""
+        request = _PendingRequest(np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float)), year, resolution,
+                                  root_seed)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.profiles, request.index
+
+    def sampling_index(self, year, resolution):
+        """Returns the sampling index of the year and resolution and marks it as most recently used; beyond
+        max_warm_profiles, the least recently used one is released from the session, see Session.release."""
+        with self._warm_lock:
+            with self.session.activated():
+                sampling_index = self.session.individual_profile(year).get_sampling_index(year, resolution)
+            self._warm[(year, resolution)] = True
+            self._warm.move_to_end((year, resolution))
+            while len(self._warm) > self.max_warm_profiles:
+                (released_year, released_resolution), _ = self._warm.popitem(last=False)
+                instrumentation.count("server.released_profiles")
+                self.session.release(released_year, released_resolution)
+        return sampling_index
+
+    def warm_profiles(self):
+        """The warm (year, resolution) pairs, least recently used first."""
+        with self._warm_lock:
+            return list(self._warm)
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        n_households = len(requests[0].e_yearly_controlled)
+        deadline = threading.Event()
+        timer = threading.Timer(self.batch_window, deadline.set)
+        timer.start()
+        while not deadline.is_set() and n_households < self.max_households:
+            try:
+                requests.append(self._queue.get(timeout=self.batch_window / 10))
+                n_households += len(requests[-1].e_yearly_controlled)
+            except queue.Empty:
+                pass
+        timer.cancel()
+        return requests
+
+    def _run(self):
+        while True:
+            groups = {}
+            for request in self._collect():
+                groups.setdefault(request.key, []).append(request)
+            for (year, resolution), requests in groups.items():
+                instrumentation.count("server.batches")
+                try:
+                    self._generate(year, resolution, requests)
+                except Exception as e:
+                    if len(requests) == 1:
+                        requests[0].error = e
+                    else:
+                        instrumentation.count("server.batch_retries")
+                        self._generate_one_by_one(year, resolution, requests)
+                for request in requests:
+                    request.done.set()
+
+    def _generate_one_by_one(self, year, resolution, requests):
+        for request in requests:
+            try:
+                self._generate(year, resolution, [request])
+            except Exception as e:
+                request.error = e
+
+    def _generate(self, year, resolution, requests):
+        rngs = [np.random.default_rng(seed_sequence) for request in requests for seed_sequence in
+                household_seed_sequences(len(request.e_yearly_controlled), request.root_seed)]
+        sampling_index = self.sampling_index(year, resolution)
+        with self.session.activated():
+            profiles = IndividualHotWaterProfile.generate_population(
+                sampling_index, np.concatenate([request.e_yearly_controlled for request in requests]), rngs,
+                days_in_year(year))
+        start = 0
+        for request in requests:
+            request.profiles = profiles[start:start + len(request.e_yearly_controlled)]
+            request.index = sampling_index.index
+            start += len(request.e_yearly_controlled)
+
+
+class _ProfileRequestHandler(BaseHTTPRequestHandler):
+    server_version = "DHWProfileServer/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send_json(404, {"error": f"Unknown path {self.path}"})
+        session = self.server.session
+        self._send_json(200, {"status": "ok", "year": session.year, "resolution": session.resolution,
+                              "warm_years": session.warm_years(),
+                              "warm_profiles": [list(key) for key in self.server.batcher.warm_profiles()]})
+
+    def do_POST(self):
+        if self.path != "/population":
+            return self._send_json(404, {"error": f"Unknown path {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if not isinstance(body, dict):
+                raise ValueError("The body must be a JSON object")
+            session = self.server.session
+            dtype = body.get("dtype", "float64")
+            if dtype not in response_dtypes:
+                raise ValueError(f"Unknown dtype {dtype}, use one of {response_dtypes}")
+            resolution = body.get("resolution") or session.resolution
+            if resolution not in supported_resolutions:
+                raise ValueError(f"Unknown resolution {resolution}, use one of {supported_resolutions}")
+            e_yearly = _validated_e_yearly(body["e_yearly"], self.server.batcher.max_households)
+            root_seed = int(body.get("seed", 0))
+            if root_seed < 0:
+                raise ValueError("seed must not be negative")
+            year = _validated_year(body.get("year"), session.year)
+            profiles, index = self.server.batcher.generate(e_yearly, year, resolution, root_seed)
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            instrumentation.count("server.errors")
+            return self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        instrumentation.count("server.requests")
+        payload = np.ascontiguousarray(profiles, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Shape", ",".join(str(n) for n in profiles.shape))
+        self.send_header("X-Dtype", dtype)
+        self.send_header("X-Index-Start", str(index[0]))
+        self.send_header("X-Index-Freq", pd.Timedelta(index[1] - index[0]).isoformat())
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class ProfileServer:
+    """HTTP server around a Session: inputs, base profiles and sampling indices stay in memory between requests.
+
+    port=0 picks a free port, see url. start() serves from a background thread, serve_forever() from the caller's."""
+
+    def __init__(self, session=None, host="127.0.0.1", port=0, batch_window=0.005, max_households=100000,
+                 max_warm_profiles=4):
+        self.session = Session() if session is None else session
+        self.httpd = ThreadingHTTPServer((host, port), _ProfileRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.session = self.session
+        self.httpd.batcher = PopulationBatcher(self.session, batch_window, max_households,
+                                                max_warm_profiles)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def warm_up(self, years=None, resolution=None):
+        """Builds the base profiles and sampling indices of the years before the first request."""
+        for year in years or [self.session.year]:
+            self.httpd.batcher.sampling_index(year, resolution or self.session.resolution)
+        return self
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class ProfileClient:
+    """Client of a ProfileServer."""
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def health(self):
+        with urlopen(f"{self.url}/health", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def population(self, e_yearly_controlled, year=None, resolution=None, seed=0, dtype="float64", as_frame=False):
+        """Returns the households x timesteps matrix in l/h, or a DataFrame with one column per household."""
+        body = json.dumps({"e_yearly": [None if np.isnan(e) else e for e in
+                                        np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float)).tolist()],
+                           "year": year, "resolution": resolution, "seed": seed, "dtype": dtype}).encode()
+        request = Request(f"{self.url}/population", data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                payload, headers = response.read(), response.headers
+        except HTTPError as e:
+            raise ValueError(json.loads(e.read()).get("error", str(e)))
+        shape = tuple(int(n) for n in headers["X-Shape"].split(","))
+        profiles = np.frombuffer(payload, dtype=np.dtype(headers["X-Dtype"]).newbyteorder("<")).reshape(shape)
+        if not as_frame:
+            return profiles
+        index = pd.date_range(start=headers["X-Index-Start"], periods=shape[1],
+                              freq=pd.Timedelta(headers["X-Index-Freq"]))
+        return pd.DataFrame(profiles.T, index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default=join(getcwd(), "config", "config.ini"))
+    parser.add_argument("--host", help="defaults to [server] host of the config, or 127.0.0.1")
+    parser.add_argument("--port", type=int, help="defaults to [server] port of the config, or 8765")
+    parser.add_argument("--batch-window", type=float, help="seconds to collect requests into a batch, defaults to "
+                                                           "[server] batch_window of the config, or 0.005")
+    arguments = parser.parse_args()
+    session = Session(arguments.config)
+    config = session.config
+    server = ProfileServer(session, arguments.host or config.get("server", "host", fallback="127.0.0.1"),
+                           arguments.port or config.getint("server", "port", fallback=8765),
+                           arguments.batch_window or config.getfloat("server", "batch_window", fallback=0.005),
+                           config.getint("server", "max_households", fallback=100000),
+                           config.getint("server", "max_warm_profiles", fallback=4))
+    server.warm_up()
+    print(f"DHW profile server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
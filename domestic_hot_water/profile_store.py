@@ -0,0 +1,91 @@
+import json
+from os.path import splitext
+
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.profile_output import ProfileWriter
+
+store_dtypes = ["float32", "float64", "uint16", "uint32"]
+
+
+class MemmapProfileWriter(ProfileWriter):
+    """Writes a population as a flat households x timesteps binary matrix plus a small JSON header.
+
+    Float dtypes store l/h as they are; the unsigned integer dtypes store round(l/h / scale) and fail on overflow
+    instead of clipping. The header records shape, dtype, scale, the time index, year, resolution and the
+    per-household metadata."""
+
+    def __init__(self, filename, index, year, resolution, dtype="float32", scale=0.01):
+        super().__init__(index, year, resolution)
+        if dtype not in store_dtypes:
+            raise ValueError(f"Unknown store dtype {dtype}, use one of {store_dtypes}")
+        self.data_file = f"{splitext(filename)[0]}.dat"
+        self.header_file = f"{splitext(filename)[0]}.json"
+        self.dtype = np.dtype(dtype)
+        self.scale = scale if self.dtype.kind == "u" else 1.
+        self.metadata = []
+        self.file = open(self.data_file, "wb")
+
+    def write(self, metadata, profiles):
+        profiles = np.asarray(profiles)
+        if self.dtype.kind == "u":
+            profiles = np.round(profiles / self.scale)
+            if profiles.max(initial=0) > np.iinfo(self.dtype).max:
+                raise ValueError(f"Profile value {profiles.max() * self.scale} l/h does not fit into {self.dtype} "
+                                 f"with scale {self.scale}, use a larger dtype or scale")
+        self.file.write(np.ascontiguousarray(profiles, dtype=self.dtype).tobytes())
+        self.metadata.append(metadata)
+        self.n_households += len(profiles)
+
+    def close(self):
+        self.file.close()
+        metadata = pd.concat(self.metadata, ignore_index=True) if self.metadata else pd.DataFrame()
+        header = {"shape": [self.n_households, len(self.index)], "dtype": self.dtype.str, "scale": self.scale,
+                  "start": str(self.index[0]), "freq": pd.infer_freq(self.index) or self.resolution,
+                  "year": self.year, "resolution": self.resolution,
+                  "households": {column: values.tolist() for column, values in metadata.items()}}
+        with open(self.header_file, "w") as f:
+            json.dump(header, f)
+        print(f"{self.n_households} DHW profiles written to: {self.data_file}")
+
+
+class MemmapProfileReader:
+    """Random access to a store written by MemmapProfileWriter without loading it.
+
+    household, households (with a slice) and time_window return zero-copy views of the memory-mapped matrix, in the
+    stored dtype; multiply integer stores by scale to get l/h, or use to_frame."""
+
+    def __init__(self, filename):
+        self.data_file = f"{splitext(filename)[0]}.dat"
+        with open(f"{splitext(filename)[0]}.json") as f:
+            header = json.load(f)
+        self.year = header["year"]
+        self.resolution = header["resolution"]
+        self.scale = header["scale"]
+        self.index = pd.date_range(start=header["start"], periods=header["shape"][1], freq=header["freq"])
+        self.metadata = pd.DataFrame(header["households"])
+        self.data = np.memmap(self.data_file, dtype=np.dtype(header["dtype"]), mode="r", shape=tuple(header["shape"]))
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def household(self, position):
+        """Profile of a single household."""
+        return self.data[position]
+
+    def households(self, selection):
+        """Profiles of a household subset; a view for slices, a copy for lists of positions."""
+        return self.data[selection]
+
+    def time_window(self, start=None, end=None, households=slice(None)):
+        """Profiles between the start and end timestamps (both included)."""
+        return self.data[households, self.index.slice_indexer(start, end)]
+
+    def to_frame(self, households=slice(None), start=None, end=None):
+        """DataFrame in l/h with one column per selected household."""
+        time_steps = self.index.slice_indexer(start, end)
+        values = np.asarray(self.data[households, time_steps], dtype=float) * self.scale
+        return pd.DataFrame(np.atleast_2d(values).T, index=self.index[time_steps],
+                            columns=np.atleast_1d(np.arange(self.shape[0])[households]))
@@ -0,0 +1,320 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.domestic_hot_water_definitions import DiscreteProfile, _l_per_discrete_profile, \
+    draw_off_statistics
+from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile, days_in_year
+from utility.definitions import seed
+from utility.instrumentation import instrumentation
+
+sweep_parameters = ["e_yearly", "hot_water_temp", "cold_water_temp", "loss_coefficient"]
+
+# Inputs (sweep parameters or other stages) every stage of a sweep point is recomputed from
+stage_dependencies = {
+    "occupants": ("e_yearly", "hot_water_temp", "cold_water_temp", "loss_coefficient"),
+    "draw_off_class": ("vol_water_l",),
+    "skeletons": ("draw_off_class",),
+    "scale": ("vol_water_l", "skeletons"),
+    "heaters": ("n_people",),
+}
+
+
+def _same(a, b):
+    return a is not None and b is not None and np.array_equal(a, b, equal_nan=True)
+
+
+def _splitmix64(x):
+    """SplitMix64 finalizer of a uint64 array, in place: every input value gives an independent output value."""
+    shifted = np.empty_like(x)
+    x += np.uint64(0x9E3779B97F4A7C15)
+    for shift, multiplier in ((30, 0xBF58476D1CE4E5B9), (27, 0x94D049BB133111EB)):
+        np.right_shift(x, np.uint64(shift), out=shifted)
+        x ^= shifted
+        x *= np.uint64(multiplier)
+    np.right_shift(x, np.uint64(31), out=shifted)
+    x ^= shifted
+    return x
+
+
+def _ranges(starts, counts):
+    """Concatenation of arange(start, start + count) over the pairs of starts and counts."""
+    ranges = np.arange(counts.sum(), dtype=np.int64)
+    ranges += np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return ranges
+
+
+class ScenarioResult:
+    """One point of a sweep: per-household metadata and the profiles, rendered from the skeletons on access.
+
+    metadata, scale and heaters stay valid. profiles and aggregate read the sweep's unscaled profiles, which are
+    updated in place for the next point, so they are only available until the sweep evaluates a point of other
+    draw-off classes; a sweep keeps one households x timesteps matrix whatever the number of points."""
+
+    def __init__(self, sweep, parameters, metadata, scale, heaters=None):
+        self.sweep = sweep
+        self.parameters = parameters
+        self.metadata = metadata
+        self.scale = scale
+        self.index = sweep.index
+        self.heaters = heaters
+        self._shapes_version = sweep._shapes_version
+
+    @property
+    def shapes(self):
+        """Unscaled profiles, shared with the sweep."""
+        if self._shapes_version != self.sweep._shapes_version:
+            raise RuntimeError("The sweep has evaluated a point of other draw-off classes since, evaluate this point "
+                               "again")
+        return self.sweep._state["shapes"]
+
+    @property
+    def profiles(self):
+        """Households x timesteps matrix in l/h, same layout as get_population_profile_from_e_yearly."""
+        return self.shapes * self.scale[:, None]
+
+    def to_frame(self):
+        return pd.DataFrame(self.profiles.T, index=self.index)
+
+    def aggregate(self):
+        """Sum of all households, without rendering them."""
+        return pd.Series(self.scale @ self.shapes, index=self.index)
+
+
+class ScenarioSweep:
+    """Evaluates a population at many points of hot_water_temp, cold_water_temp, loss_coefficient and yearly energy.
+
+    A household's draw-off times only depend on its draw-off class (discrete profile and, for MULTIPLE_HEAVY, the
+    number of HEAVY blocks) and random numbers. Here the random numbers of the n-th draw-off of a household in a
+    discrete profile are a hash of (root_seed, household, profile, n), not a draw from a stream, so the draw-offs of
+    any set of households are sampled in one vectorized batch and more HEAVY blocks only add draw-offs. A point then
+    only recomputes the stages whose inputs changed (see stage_dependencies): the closed-form yearly volume and
+    occupants, the classes, the profiles of the households whose class changed, the rescaling to the yearly volume
+    and the heater sizing. Results do not depend on the order of the points. The time steps sampled for
+    MULTIPLE_HEAVY households are kept, as they are the bulk of the draw-offs."""
+
+    def __init__(self, individual_profile, e_yearly_controlled, year=None, resolution=None, root_seed=seed):
+        if year is None:
+            year = individual_profile.year
+        self.n_days = days_in_year(year)
+        self.sampling_index = individual_profile.get_sampling_index(year, resolution)
+        self.index = self.sampling_index.index
+        self.root_seed = root_seed
+        self.e_yearly = np.atleast_1d(np.asarray(e_yearly_controlled, dtype=float))
+        # Volumes of the draw-offs of one block per discrete profile; MULTIPLE_HEAVY households get several HEAVY blocks
+        self._block_volumes = [np.repeat(statistics.volume_l.values.astype(float), statistics.occurrence.values)
+                               for statistics in (draw_off_statistics.get(profile, draw_off_statistics[
+                                   DiscreteProfile.HEAVY]) for profile in DiscreteProfile)]
+        # One key per household and discrete profile, the n-th draw-off of that profile hashes key + n
+        root_key = _splitmix64(np.array([root_seed % 2 ** 64], dtype=np.uint64))
+        household_keys = _splitmix64(root_key ^ np.arange(self.n_households, dtype=np.uint64))
+        self._keys = _splitmix64(household_keys[:, None] ^ (np.arange(len(DiscreteProfile), dtype=np.uint64) <<
+                                                             np.uint64(56)))
+        self._block_totals = np.array([volumes.sum() for volumes in self._block_volumes])
+        # Time steps of the blocks of MULTIPLE_HEAVY households sampled so far, packed in one flat array: row r holds
+        # blocks[r] sampled blocks at [offsets[r], offsets[r] + blocks[r] * block size), with room for capacity[r]
+        self._multiple_heavy = list(DiscreteProfile).index(DiscreteProfile.MULTIPLE_HEAVY)
+        self._cached_rows = np.full(self.n_households, -1)
+        self._cached_offsets = np.zeros(0, dtype=np.int64)
+        self._cached_blocks = np.zeros(0, dtype=np.int64)
+        self._cached_capacity = np.zeros(0, dtype=np.int64)
+        self._cached_time_steps = np.zeros(0, dtype=np.int32)
+        self._cached_size = 0
+        self._state = {}
+        self._computed = set()
+        self._shapes_version = 0
+
+    @property
+    def n_households(self):
+        return len(self.e_yearly)
+
+    @staticmethod
+    def grid(**values):
+        """Every combination of the given parameter values, as a list of points for run."""
+        return [dict(zip(values, point)) for point in itertools.product(*values.values())]
+
+    def run(self, points, heaters=False):
+        """Evaluates the points one after the other, yields a ScenarioResult per point."""
+        for point in points:
+            yield self.evaluate(heaters=heaters, **point)
+
+    def evaluate(self, heaters=False, **parameters):
+        """Evaluates one point; parameters not given take the configured values (e_yearly the sweep's energies)."""
+        unknown = set(parameters) - set(sweep_parameters)
+        if unknown:
+            raise ValueError(f"Unknown sweep parameters {sorted(unknown)}, use {sweep_parameters}")
+        point = {"e_yearly": self.e_yearly, "hot_water_temp": IndividualHotWaterProfile.hot_water_temp,
+                 "cold_water_temp": IndividualHotWaterProfile.cold_water_temp,
+                 "loss_coefficient": IndividualHotWaterProfile.loss_coefficient}
+        point.update(parameters)
+        point["e_yearly"] = np.broadcast_to(np.asarray(point["e_yearly"], dtype=float), self.e_yearly.shape)
+
+        for name, value in point.items():
+            self._update(name, value)
+        state = self._state
+        if self._stale("occupants"):
+            e_yearly = point["e_yearly"]
+            valid = ~np.isnan(e_yearly) & (e_yearly != 0.)
+            vol_water_used, n_people = IndividualHotWaterProfile.calc_number_of_occupants(
+                np.where(valid, e_yearly, 0.), point["hot_water_temp"], point["cold_water_temp"],
+                point["loss_coefficient"])
+            state["valid"] = valid
+            self._update("vol_water_l", vol_water_used)
+            self._update("n_people", n_people)
+            self._done("occupants")
+        if self._stale("draw_off_class"):
+            self._update("draw_off_class", self._draw_off_classes(state["vol_water_l"], state["valid"], self.n_days))
+            self._done("draw_off_class")
+        if self._stale("skeletons"):
+            self._update_skeletons()
+            self._done("skeletons")
+        if self._stale("scale"):
+            scale = state["vol_water_l"].copy()
+            np.divide(scale, state["totals"], out=scale, where=state["totals"] > 0)
+            state["scale"] = np.where(state["totals"] > 0, scale, 0.)
+            self._done("scale")
+        if heaters and self._stale("heaters"):
+            state["heaters"] = IndividualHotWaterProfile.calc_heater_size_population(state["n_people"])
+            self._done("heaters")
+
+        profiles = np.array([profile.value for profile in DiscreteProfile] + [""])
+        metadata = pd.DataFrame({"e_yearly": point["e_yearly"], "vol_water_l": state["vol_water_l"],
+                                 "n_people": state["n_people"],
+                                 "discrete_profile": profiles[state["draw_off_class"][:, 0]]})
+        return ScenarioResult(self, dict(parameters), metadata, state["scale"],
+                              state.get("heaters") if heaters else None)
+
+    def _update(self, name, value):
+        """Stores a parameter or stage output, invalidating the stages that depend on it if it changed."""
+        if not _same(self._state.get(name), value):
+            self._invalidate(name)
+        self._state[name] = value
+
+    def _invalidate(self, name):
+        for stage, inputs in stage_dependencies.items():
+            if name in inputs:
+                self._computed.discard(stage)
+
+    def _stale(self, stage):
+        if stage in self._computed:
+            return False
+        instrumentation.count(f"sweep.{stage}")
+        return True
+
+    def _done(self, stage):
+        self._computed.add(stage)
+
+    @staticmethod
+    def _draw_off_classes(vol_water_l, valid, n_days):
+        """Households x (discrete profile position, number of heavy profiles); position -1 for invalid households."""
+        codes = IndividualHotWaterProfile._get_discrete_water_usage_profiles(vol_water_l, n_days)
+        multiple_heavy = codes == list(DiscreteProfile).index(DiscreteProfile.MULTIPLE_HEAVY)
+        multiplier = np.where(multiple_heavy,
+                              np.ceil(vol_water_l / _l_per_discrete_profile[DiscreteProfile.HEAVY]), 1)
+        return np.stack([np.where(valid, codes, -1), np.where(valid, multiplier, 0)], axis=1).astype(np.int64)
+
+    def _time_steps(self, households, code, first_block, last_block):
+        """Time steps of the draw-offs of blocks [first_block, last_block) of households in one discrete profile,
+        household after household."""
+        block_size = len(self._block_volumes[code])
+        counts = (last_block - first_block) * block_size
+        # Key of the household plus the number of the draw-off in the profile
+        bits = np.arange(counts.sum(), dtype=np.uint64)
+        bits += np.repeat(self._keys[households, code] - (np.cumsum(counts) - counts - first_block * block_size).astype(
+            np.uint64), counts)
+        instrumentation.count("sweep.draw_offs_sampled", len(bits))
+        return self.sampling_index.sample_bits(_splitmix64(bits))
+
+    def _multiple_heavy_time_steps(self, households, first_block, last_block):
+        """_time_steps of MULTIPLE_HEAVY households, kept so that households which come back to MULTIPLE_HEAVY or to
+        a number of blocks they had before are not sampled again."""
+        block_size = len(self._block_volumes[self._multiple_heavy])
+        rows = self._cached_rows[households]
+        new = rows < 0
+        rows[new] = len(self._cached_blocks) + np.arange(new.sum())
+        self._cached_rows[households[new]] = rows[new]
+        empty = np.zeros(new.sum(), dtype=np.int64)
+        self._cached_offsets, self._cached_blocks, self._cached_capacity = (
+            np.concatenate([cached, empty]) for cached in (self._cached_offsets, self._cached_blocks,
+                                                             self._cached_capacity))
+        grow = last_block > self._cached_capacity[rows]
+        if grow.any():
+            # Half as much room again as needed, so that households slowly gaining blocks are rarely moved
+            self._reserve(rows[grow], np.maximum(last_block[grow], self._cached_capacity[rows[grow]] * 3 // 2),
+                          block_size)
+        missing = last_block > self._cached_blocks[rows]
+        if missing.any():
+            sampled = self._cached_blocks[rows[missing]]
+            self._cached_time_steps[_ranges(self._cached_offsets[rows[missing]] + sampled * block_size, (
+                    last_block[missing] - sampled) * block_size)] = self._time_steps(
+                households[missing], self._multiple_heavy, sampled, last_block[missing])
+            self._cached_blocks[rows[missing]] = last_block[missing]
+        return self._cached_time_steps.take(_ranges(self._cached_offsets[rows] + first_block * block_size,
+                                                     (last_block - first_block) * block_size))
+
+    def _reserve(self, rows, capacity, block_size):
+        """Moves the rows to the end of the flat array with room for capacity blocks each. Once the array is full, all
+        rows are packed into a new one instead, dropping the space of moved rows."""
+        target = self._cached_time_steps
+        start = self._cached_size
+        if start + capacity.sum() * block_size > len(target):
+            all_capacity = self._cached_capacity.copy()
+            all_capacity[rows] = capacity
+            rows, capacity = np.arange(len(all_capacity)), all_capacity
+            target = np.zeros(capacity.sum() * block_size * 3 // 2, dtype=np.int32)
+            start = 0
+        sizes = capacity * block_size
+        offsets = start + np.cumsum(sizes) - sizes
+        counts = self._cached_blocks[rows] * block_size
+        target[_ranges(offsets, counts)] = self._cached_time_steps[_ranges(self._cached_offsets[rows], counts)]
+        self._cached_time_steps = target
+        self._cached_offsets[rows] = offsets
+        self._cached_capacity[rows] = capacity
+        self._cached_size = start + sizes.sum()
+
+    def _update_skeletons(self):
+        """Updates the unscaled profiles of the households whose draw-off class changed, in place.
+
+        A household that changed profile is rendered again, a MULTIPLE_HEAVY household that only changed its number
+        of HEAVY blocks gets the blocks in between added or removed. Households are sampled in one batch per
+        discrete profile."""
+        state = self._state
+        draw_off_class = state["draw_off_class"]
+        n_steps = self.sampling_index.n_steps
+        if "shapes" not in state:
+            state["shapes"], state["totals"] = np.zeros((self.n_households, n_steps)), np.zeros(self.n_households)
+            state["shape_classes"] = np.stack([np.full(self.n_households, -1), np.zeros(self.n_households, dtype=int)],
+                                              axis=1)
+        shapes, totals, shape_classes = state["shapes"], state["totals"], state["shape_classes"]
+        households = np.flatnonzero(np.any(draw_off_class != shape_classes, axis=1))
+        if len(households) == 0:
+            return
+        (old_code, old_blocks), (code, n_blocks) = shape_classes[households].T, draw_off_class[households].T
+        same_code = code == old_code
+        shapes[households[~same_code]] = 0.
+        totals[households[~same_code]] = 0.
+        # Blocks [first_block, last_block) are added, or removed for a MULTIPLE_HEAVY household with fewer blocks
+        first_block = np.where(same_code, np.minimum(old_blocks, n_blocks), 0)
+        last_block = np.where(same_code, np.maximum(old_blocks, n_blocks), n_blocks)
+        sign = np.where(same_code & (n_blocks < old_blocks), -1., 1.)
+
+        for profile in np.unique(code[code >= 0]).tolist():
+            selected = code == profile
+            counts = (last_block[selected] - first_block[selected]) * len(self._block_volumes[profile])
+            # Events are whole blocks in order, so their volumes are the block volumes tiled
+            volumes = np.tile(self._block_volumes[profile], (last_block - first_block)[selected].sum())
+            if np.any(sign[selected] < 0):
+                volumes *= np.repeat(sign[selected], counts)
+            if profile == self._multiple_heavy:
+                time_steps = self._multiple_heavy_time_steps(households[selected], first_block[selected],
+                                                             last_block[selected])
+            else:
+                time_steps = self._time_steps(households[selected], profile, first_block[selected],
+                                              last_block[selected])
+            np.add.at(shapes.reshape(-1), np.repeat(households[selected] * n_steps, counts) + time_steps, volumes)
+        valid = code >= 0
+        totals[households[valid]] += sign[valid] * (last_block - first_block)[valid] * self._block_totals[code[valid]]
+        state["shape_classes"] = draw_off_class
+        self._shapes_version += 1
+        self._invalidate("skeletons")
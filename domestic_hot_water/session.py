@@ -0,0 +1,127 @@
+import threading
+from functools import cached_property
+from os.path import join
+
+from domestic_hot_water.profile_cache import household_cache, profile_cache
+from utility.configuration import ConfigurationManager, active_configuration, config_file
+
+
+class Session:
+    """Entry point that loads the configuration and the input tables lazily, on first use, and keeps them.
+
+    Nothing is read when the session is created; the first access of a profile parses the config, dhwp.txt and
+    water_heater.csv once, later accesses reuse them. A session has its own ConfigurationManager, of config_filename
+    or of the default config file, and its own profile caches configured from it; the global config is left alone.
+    The session's methods read its config, and so does the module-level API inside a `with session:` block, e.g. for
+    the profiles a session returns."""
+
+    def __init__(self, config_filename=None):
+        self.config = ConfigurationManager(config_file if config_filename is None else config_filename)
+        self.profile_cache = profile_cache.with_configuration(self.config)
+        self.household_cache = household_cache.with_configuration(self.config)
+        self._dhw_profiles = {}
+        self._individual_profiles = {}
+        self._activations = threading.local()
+
+    def activated(self):
+        """Context manager making the session's config the active one in this thread, see active_configuration."""
+        return active_configuration(self.config)
+
+    def __enter__(self):
+        activation = self.activated()
+        self._activations.__dict__.setdefault("stack", []).append(activation)
+        activation.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._activations.stack.pop().__exit__(exc_type, exc_val, exc_tb)
+
+    @property
+    def year(self):
+        return self.config.getint("time", "simulation_year")
+
+    @property
+    def resolution(self):
+        return self.config.get("time", "resolution")
+
+    @property
+    def input_file(self):
+        return join(self.config.get("path", "input"), "dhwp.txt")
+
+    @cached_property
+    def water_heater_data(self):
+        from domestic_hot_water.domestic_hot_water_definitions import WaterHeaterData
+        return WaterHeaterData(self.config.get("path", "input"))
+
+    def dhw_profile(self, year=None):
+        """Returns the DomesticHotWaterProfile of the year, parsed once per session."""
+        from domestic_hot_water.domestic_hot_water_profile import DomesticHotWaterProfile
+        year = self.year if year is None else year
+        if year not in self._dhw_profiles:
+            with self.activated():
+                self._dhw_profiles[year] = DomesticHotWaterProfile(self.input_file, year, self.profile_cache)
+        return self._dhw_profiles[year]
+
+    def individual_profile(self, year=None):
+        """Returns the IndividualHotWaterProfile of the year, whose sampling indices are kept across calls."""
+        from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile
+        year = self.year if year is None else year
+        if year not in self._individual_profiles:
+            self._individual_profiles[year] = IndividualHotWaterProfile(self.dhw_profile(year))
+        return self._individual_profiles[year]
+
+    def warm_years(self):
+        """Sorted years whose IndividualHotWaterProfile the session keeps."""
+        return sorted(list(self._individual_profiles))
+
+    def release(self, year, resolution=None):
+        """Drops the sampling index of the year and resolution; once the year has none left, its DHW profiles are
+        dropped too and parsed again on next use."""
+        individual_profile = self._individual_profiles.get(year)
+        if individual_profile is None:
+            return
+        individual_profile.release_sampling_index(year, resolution or self.resolution)
+        if not individual_profile.sampling_index_keys():
+            self._individual_profiles.pop(year, None)
+            self._dhw_profiles.pop(year, None)
+
+    def yearly_profile(self, year=None, resolution=None):
+        """Returns the yearly base profile, see DomesticHotWaterProfile.return_yearly_profile."""
+        import pandas as pd
+        year = self.year if year is None else year
+        with self.activated():
+            return self.dhw_profile(year).return_yearly_profile(
+                pd.date_range(start=f"{year}-01-01", end=f"{year}-12-31"), resolution or self.resolution)
+
+    def multi_year_population(self, e_yearly_controlled, start_year=None, n_years=1, resolution=None, period="year"):
+        """Streams a population over several years, see multi_year.iter_multi_year_population."""
+        from domestic_hot_water.multi_year import iter_multi_year_population
+        start_year = self.year if start_year is None else start_year
+        return self._activated_iterator(iter_multi_year_population(
+            self.individual_profile(start_year), e_yearly_controlled, start_year, n_years,
+            resolution or self.resolution, period))
+
+    def population_profile(self, e_yearly_controlled, year=None, resolution=None, rng=None, as_frame=False):
+        """Generates a population, see IndividualHotWaterProfile.get_population_profile_from_e_yearly."""
+        year = self.year if year is None else year
+        with self.activated():
+            return self.individual_profile(year).get_population_profile_from_e_yearly(
+                e_yearly_controlled, year, resolution or self.resolution, rng, as_frame)
+
+    def keyed_households(self, year=None, root_seed=None):
+        """Returns a KeyedHouseholds of the year, see keyed_households.py, use it inside `with session:`."""
+        from domestic_hot_water.keyed_households import KeyedHouseholds
+        from utility.definitions import seed
+        year = self.year if year is None else year
+        return KeyedHouseholds(self.individual_profile(year), year, seed if root_seed is None else root_seed,
+                               self.household_cache)
+
+    def _activated_iterator(self, iterator):
+        """Yields the items of the iterator, each one produced with the session's config active."""
+        while True:
+            with self.activated():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
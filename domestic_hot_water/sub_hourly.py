@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+supported_resolutions = ["1min", "5min", "15min", "1h"]
+
+
+def steps_per_hour(resolution):
+    """Number of time steps per hour at the resolution."""
+    if resolution not in supported_resolutions:
+        raise ValueError(f"Unknown resolution {resolution}, use one of {supported_resolutions}")
+    return int(pd.Timedelta("1h") / pd.Timedelta(resolution))
+
+
+def day_templates(hourly, n_steps_per_hour):
+    """Interpolates day types x 24 hours x profiles hourly values to day types x (24 * n_steps_per_hour) x profiles.
+
+    Every day type is interpolated on its own with a periodic Catmull-Rom cubic through the values at the full hours,
+    clipped at zero, then every hour is rescaled so that its mean equals the hourly value: the template resampled to
+    hours gives back the input exactly. Computed once per day type, the templates are tiled across the year."""
+    if n_steps_per_hour == 1:
+        return hourly
+    p0, p1, p2, p3 = (np.roll(hourly, shift, axis=1) for shift in (1, 0, -1, -2))
+    f = (np.arange(n_steps_per_hour) / n_steps_per_hour)[None, None, :, None]
+    p0, p1, p2, p3 = (p[:, :, None, :] for p in (p0, p1, p2, p3))
+    templates = 0.5 * (2 * p1 + (p2 - p0) * f + (2 * p0 - 5 * p1 + 4 * p2 - p3) * f ** 2 +
+                       (3 * p1 - p0 - 3 * p2 + p3) * f ** 3)
+    templates = np.clip(templates, 0, None)
+    hour_mean = templates.mean(axis=2, keepdims=True)
+    hourly = hourly[:, :, None, :]
+    templates = np.where(hour_mean > 0, templates * np.divide(hourly, hour_mean, where=hour_mean > 0,
+                                                              out=np.zeros_like(hour_mean)), hourly)
+    return templates.reshape(hourly.shape[0], -1, hourly.shape[-1])
@@ -1,20 +1,49 @@
-from os.path import join
+from os.path import exists, getsize, join
+from sys import argv
 
-import matplotlib.pyplot as plt
 import pandas as pd
 from pandas import date_range
 
 from domestic_hot_water.domestic_hot_water_profile import DomesticHotWaterProfile, IndividualHotWaterProfile
+from domestic_hot_water.profile_output import create_writer, write_legacy_population, write_population
 from utility.configuration import config
+from utility.definitions import seed_global_random_states
+from utility.instrumentation import instrumentation, profiling
 
 
-def main():
-    """Generate one or more DHW profiles for given yearly energies and plot them."""
+def main(profile=None):
+    """Generate one or more DHW profiles for given yearly energies and plot them.
+
+    profile is the filename of a JSON profiling report (see utility/instrumentation.py), True for
+    dhw_profiling_{year}.json in the output directory, or None to run without instrumentation."""
+    seed_global_random_states()
+    if not profile:
+        all_profiles = generate_profiles()
+    else:
+        with profiling():
+            try:
+                all_profiles = generate_profiles()
+            finally:
+                instrumentation.write_report(profile if isinstance(profile, str) else join(
+                    config.get("path", "network"), f"dhw_profiling_{config.getint('time', 'simulation_year')}.json"))
+    if all_profiles is not None:
+        plot_profiles(all_profiles, config.getint("time", "simulation_year"))
+
+
+def _count_bytes_written(filename):
+    if instrumentation.enabled and exists(filename):
+        instrumentation.count("bytes_written", getsize(filename))
+
+
+def generate_profiles():
+    """Generates and writes the profiles, returns them as one DataFrame (None for binary output formats)."""
     # --- Read basic settings from config.ini ---
     input_directory = config.get("path", "input")
     output_directory = config.get("path", "network")  # reuse existing key for output dir
     year = config.getint("time", "simulation_year")
     resolution = config.get("time", "resolution")  # e.g. "1h" or "15min"
+    # csv (default, per-profile and combined files), hdf5 or parquet
+    output_format = config.get("output", "format") if config.has_option("output", "format") else "csv"
 
     # Example parameters: list of yearly electric energies used for DHW (kWh)
     # You can add this to config.ini under [domestic_hot_water] as comma-separated values, e.g.
@@ -28,41 +57,43 @@ def main():
     dhwp_file = join(input_directory, "dhwp.txt")
 
     # --- Build base stochastic daily/seasonal DHW shape (keeps original DHW logic intact) ---
-    dhwp = DomesticHotWaterProfile(dhwp_file, year)
-    base_profile = dhwp.return_yearly_profile(
-        date_range(start=f"{year}-01-01", end=f"{year}-12-31"), resolution
-    )
+    with instrumentation.stage("main.base_profile"):
+        dhwp = DomesticHotWaterProfile(dhwp_file, year)
+        base_profile = dhwp.return_yearly_profile(
+            date_range(start=f"{year}-01-01", end=f"{year}-12-31"), resolution
+        )
 
     # --- Create individual profiles for all requested yearly energies ---
     ihwp = IndividualHotWaterProfile(dhwp)
-    profiles = {}
-
-    for e_yearly in e_yearly_list:
-        profile = ihwp.get_individual_profile_from_e_yearly(e_yearly, year)
-        if profile is None:
-            continue
-        key = f"{int(e_yearly)}kWh"
-        profiles[key] = profile["Hot water [l/h]"]  # store as Series for easy concat
 
-        # Save individual profile
-        single_profile_file = join(output_directory, f"dhw_profile_{year}_{int(e_yearly)}kWh.csv")
-        profile.to_csv(single_profile_file)
-        print(f"DHW profile written to: {single_profile_file}")
-
-    if not profiles:
+    # Stream chunks of households to the writer; only csv keeps the whole population, for the combined file
+    with instrumentation.stage("main.write_population"):
+        with create_writer(output_format, output_directory, base_profile.index, year, resolution) as writer:
+            if output_format == "csv" and not config.has_option("parallel", "workers"):
+                # Legacy path: one household after another from the seeded random module
+                write_legacy_population(ihwp, e_yearly_list, writer, year)
+            else:
+                # One random stream per household, see [parallel] in config.ini
+                write_population(ihwp, e_yearly_list, writer, year, resolution,
+                                 root_seed=config.getint("parallel", "seed", fallback=0))
+    for filename in getattr(writer, "filenames", [getattr(writer, "filename", None)]):
+        if filename is not None:
+            _count_bytes_written(filename)
+
+    if output_format != "csv":
+        return None
+    if writer.combined is None:
         print("No valid yearly energies provided, nothing to generate.")
-        return
+    return writer.combined
+
 
-    # --- Combine all profiles into one DataFrame ---
-    all_profiles = pd.concat(profiles, axis="columns")
-    combined_file = join(output_directory, f"dhw_profiles_{year}_combined.csv")
-    all_profiles.to_csv(combined_file)
-    print(f"Combined DHW profiles written to: {combined_file}")
+def plot_profiles(all_profiles, year):
+    """Minimal visualization of the generated profiles."""
+    import matplotlib.pyplot as plt  # only needed here, keeps headless and binary output runs free of matplotlib
 
-    # --- Minimal visualization ---
     # Use the first generated profile as reference for full-year plot
-    first_key = next(iter(profiles))
-    first_profile = profiles[first_key]
+    first_key = all_profiles.columns[0]
+    first_profile = all_profiles[first_key]
 
     # 1) plot full-year time series for one representative profile
     plt.figure(figsize=(10, 4))
@@ -104,4 +135,6 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # --profile writes the profiling report to the output directory, --profile=report.json to report.json
+    main(next((argument.partition("=")[2] or True for argument in argv[1:]
+               if argument.partition("=")[0] == "--profile"), None))
@@ -0,0 +1,40 @@
+import sys
+from os.path import abspath, dirname, join
+
+import pytest
+
+repository_directory = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, repository_directory)
+fixtures_directory = join(repository_directory, "benchmarks", "fixtures")
+
+from domestic_hot_water.session import Session  # noqa: E402
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    """Config on the benchmark fixtures, outputs in a temporary directory."""
+    filename = tmp_path / "config.ini"
+    filename.write_text(f"""[path]
+input = {fixtures_directory}
+network = {tmp_path}
+output = {tmp_path}
+
+[time]
+simulation_year = 2021
+resolution = 1h
+
+[domestic_hot_water]
+stored_water_temp = 50
+hot_water_temp = 40
+cold_water_temp = 10
+environment_temp = 20
+loss_coefficient = 0.95
+""")
+    return str(filename)
+
+
+@pytest.fixture
+def session(config_file):
+    """Session on config_file, active for the whole test."""
+    with Session(config_file) as session:
+        yield session
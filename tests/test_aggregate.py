@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from domestic_hot_water.aggregate import FeederAggregator
+from domestic_hot_water.parallel_generation import generate_population_parallel
+from domestic_hot_water.profile_output import write_population
+
+percentiles = (5, 50, 95, 99, 100)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000])
+def test_aggregate_matches_population_statistics(session, chunk_size):
+    individual_profile = session.individual_profile()
+    e_yearly = np.random.default_rng(1).choice([np.nan, 0., 800., 1500., 2400., 4000., 9000.], 60)
+    index = individual_profile.get_sampling_index().index
+    aggregator = FeederAggregator(index, 2021, "1h", percentiles, relative_accuracy=0.02)
+    write_population(individual_profile, e_yearly, aggregator, root_seed=3, chunk_size=chunk_size, workers=1)
+    population = generate_population_parallel(individual_profile, e_yearly, root_seed=3, workers=1)
+
+    result = aggregator.result()
+    assert aggregator.n_households == len(e_yearly)
+    np.testing.assert_allclose(result["sum"], population.sum(axis=0), rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(result["mean"], population.mean(axis=0), rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(result["std"], population.std(axis=0, ddof=1), rtol=1e-9, atol=1e-9)
+    for percentile in percentiles:
+        exact = np.percentile(population, percentile, axis=0, method="lower")
+        estimate = result[f"p{percentile:g}"].to_numpy()
+        # Values below the sketch's min_value count as zero
+        small = exact < aggregator.sketch.min_value
+        assert np.all(estimate[small] == 0.)
+        assert np.all(np.abs(estimate - exact)[~small] <= 0.02 * exact[~small] * (1 + 1e-9))
+    assert aggregator.peak == pytest.approx(population.sum(axis=0).max())
+    assert aggregator.coincidence_factor == pytest.approx(population.sum(axis=0).max() /
+                                                          population.max(axis=1).sum())
@@ -0,0 +1,10 @@
+from utility.configuration import ConfigurationManager
+
+
+def test_getarray_single_and_multiple_values(tmp_path):
+    filename = tmp_path / "config.ini"
+    filename.write_text("[output]\npercentiles = 50\n\n[domestic_hot_water]\ne_yearly_list = 1000,1500,2000\n")
+    config = ConfigurationManager(str(filename))
+    assert config.getarray("output", "percentiles", dtype=float) == [50.]
+    assert config.getarray("domestic_hot_water", "e_yearly_list", dtype=float) == [1000., 1500., 2000.]
+    assert config.getarray("output", "missing", dtype=float, fallback="5,50,95") == [5., 50., 95.]
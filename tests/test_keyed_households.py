@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.keyed_households import KeyedHouseholds
+from domestic_hot_water.profile_cache import ProfileCache
+from utility.definitions import household_generators
+
+e_yearly = np.array([800., 1500., np.nan, 2400., 9000.])
+
+
+def test_keyed_household_is_population_row(session):
+    individual_profile = session.individual_profile()
+    population = individual_profile.get_population_profile_from_e_yearly(
+        e_yearly, rng=household_generators(len(e_yearly), 5))
+    households = KeyedHouseholds(individual_profile, root_seed=5, cache=ProfileCache())
+    for key in (0, 1, 3, 4):
+        np.testing.assert_allclose(households.profile(key, e_yearly[key])["Hot water [l/h]"].values,
+                                   population[key], rtol=1e-12)
+    assert households.profile(2, e_yearly[2]) is None
+
+
+def test_cached_household_equals_generated(session, tmp_path):
+    individual_profile = session.individual_profile()
+    uncached = KeyedHouseholds(individual_profile, root_seed=5, cache=None).profile("a", 1500.)
+    for cache in (ProfileCache(), ProfileCache(directory=str(tmp_path / "households"))):
+        households = KeyedHouseholds(individual_profile, root_seed=5, cache=cache)
+        households.profile("a", 1500.)
+        cache._memory.clear()
+        pd.testing.assert_frame_equal(households.profile("a", 1500.), uncached)
@@ -0,0 +1,22 @@
+from os.path import join
+
+import numpy as np
+
+from conftest import fixtures_directory
+from domestic_hot_water.domestic_hot_water_profile import DomesticHotWaterProfile, IndividualHotWaterProfile
+from domestic_hot_water.multi_year import iter_multi_year_population
+from domestic_hot_water.profile_cache import ProfileCache
+
+e_yearly = np.array([800., 1500., np.nan, 2400.])
+
+
+def test_years_do_not_stay_in_memory(session):
+    cache = ProfileCache()
+    individual_profile = IndividualHotWaterProfile(DomesticHotWaterProfile(join(fixtures_directory, "dhwp.txt"), 2021,
+                                                                           cache))
+    entries = len(cache._memory)
+    for year, (index, profiles) in zip(range(2021, 2024), iter_multi_year_population(individual_profile, e_yearly,
+                                                                                     2021, 3)):
+        assert index[0].year == year and profiles.shape == (len(e_yearly), len(index))
+        assert len(cache._memory) == entries
+        assert individual_profile._sampling_indices == {}
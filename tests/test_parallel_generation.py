@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from domestic_hot_water.parallel_generation import generate_population_parallel, iter_population_chunks
+from utility.instrumentation import profiling
+
+e_yearly = np.array([800., 1500., np.nan, 2400., 0., 9000., 1200.])
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_worker_count_does_not_change_population(session, tmp_path, monkeypatch, start_method):
+    # Run from a directory without config/config.ini, workers must not depend on the parent's cwd or config
+    monkeypatch.chdir(tmp_path)
+    individual_profile = session.individual_profile()
+    serial = generate_population_parallel(individual_profile, e_yearly, root_seed=3, workers=1)
+    parallel = generate_population_parallel(individual_profile, e_yearly, root_seed=3, workers=2, chunk_size=2,
+                                            start_method=start_method)
+    np.testing.assert_array_equal(serial, parallel)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunks_concatenate_to_population(session, workers):
+    individual_profile = session.individual_profile()
+    population = generate_population_parallel(individual_profile, e_yearly, root_seed=3, workers=1)
+    chunks = list(iter_population_chunks(individual_profile, e_yearly, root_seed=3, chunk_size=3, workers=workers))
+    assert [start for start, _ in chunks] == [0, 3, 6]
+    np.testing.assert_array_equal(np.concatenate([profiles for _, profiles in chunks]), population)
+
+
+def test_worker_instrumentation_is_merged(session):
+    individual_profile = session.individual_profile()
+    counters = []
+    for workers in (1, 2):
+        with profiling() as instrumentation:
+            generate_population_parallel(individual_profile, e_yearly, workers=workers, chunk_size=2)
+        assert "IndividualHotWaterProfile.sample_draw_offs" in instrumentation.stages
+        counters.append(instrumentation.counters["draw_offs_placed"])
+    assert counters[0] == counters[1] > 0
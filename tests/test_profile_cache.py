@@ -0,0 +1,59 @@
+import multiprocessing
+import time
+from os import listdir, utime
+from os.path import getsize, join
+
+import numpy as np
+
+from domestic_hot_water.profile_cache import ProfileCache
+
+
+def test_disk_tier_is_evicted_least_recently_used_first(tmp_path):
+    directory = str(tmp_path / "cache")
+    cache = ProfileCache(directory=directory, max_disk_bytes=20000)
+    for key in range(20):
+        cache.put(("household", key), np.full(1000, float(key)))
+        # Read from disk, which makes it the most recently used file
+        cache._memory.clear()
+        cache.get(("household", 0))
+        assert sum(getsize(join(directory, f)) for f in listdir(directory)) <= 20000
+    cache._memory.clear()
+    np.testing.assert_array_equal(cache.get(("household", 0)), np.zeros(1000))
+    np.testing.assert_array_equal(cache.get(("household", 19)), np.full(1000, 19.))
+    assert cache.get(("household", 1)) is None
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    cache = ProfileCache(max_entries=100, max_memory_bytes=10 * 8000)
+    for key in range(20):
+        cache.put(key, np.zeros(1000))
+    assert list(cache._memory) == list(range(10, 20))
+    cache.invalidate(19)
+    assert cache._memory_bytes == 9 * 8000
+
+
+def _put_and_get(directory):
+    cache = ProfileCache(directory=directory, max_disk_bytes=50000)
+    for i in range(100):
+        cache.put(("household", i % 7), np.full(1000, float(i % 7)))
+        cache._memory.clear()
+        value = cache.get(("household", (i + 3) % 7))
+        assert value is None or np.all(value == (i + 3) % 7)
+
+
+def test_processes_share_the_disk_tier(tmp_path):
+    directory = str(tmp_path / "cache")
+    with multiprocessing.Pool(4) as pool:
+        pool.map(_put_and_get, [directory] * 4)
+    assert all(f.endswith(".npz") for f in listdir(directory))
+
+
+def test_stale_temporary_files_are_removed(tmp_path):
+    directory = tmp_path / "cache"
+    cache = ProfileCache(directory=str(directory))
+    stale, recent = directory / "stale.npz.1.tmp", directory / "recent.npz.2.tmp"
+    stale.write_bytes(b"partial")
+    recent.write_bytes(b"partial")
+    utime(stale, (time.time() - 7200, time.time() - 7200))
+    cache.invalidate()
+    assert listdir(directory) == ["recent.npz.2.tmp"]
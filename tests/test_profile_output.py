@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile
+from domestic_hot_water.parallel_generation import generate_population_parallel
+from domestic_hot_water.profile_output import (create_writer, read_hdf5_profiles, read_parquet_profiles,
+                                               write_population)
+
+e_yearly = np.array([800., 1500., np.nan, 2400., 0., 9000., 1200.])
+
+
+@pytest.mark.parametrize("output_format, module, read", [("hdf5", "h5py", read_hdf5_profiles),
+                                                         ("parquet", "pyarrow", read_parquet_profiles)])
+def test_chunked_output_reads_back_as_population(session, tmp_path, output_format, module, read):
+    pytest.importorskip(module)
+    individual_profile = session.individual_profile()
+    index = individual_profile.get_sampling_index().index
+    with create_writer(output_format, str(tmp_path), index, 2021, "1h") as writer:
+        write_population(individual_profile, e_yearly, writer, root_seed=3, chunk_size=3, workers=1)
+    assert writer.n_households == len(e_yearly)
+
+    households = [5, 1, 5]
+    profiles, metadata = read(writer.filename, households)
+    population = generate_population_parallel(individual_profile, e_yearly, root_seed=3, workers=1)
+    np.testing.assert_array_equal(profiles.to_numpy().T, population[households])
+    assert profiles.index.equals(index)
+    expected = IndividualHotWaterProfile.get_population_metadata(e_yearly).iloc[households].reset_index(drop=True)
+    assert list(metadata.columns) == ["e_yearly", "vol_water_l", "n_people", "discrete_profile"]
+    pd.testing.assert_frame_equal(metadata, expected, check_dtype=False)
+
+
+def test_csv_output_holds_households_with_hot_water(session, tmp_path):
+    individual_profile = session.individual_profile()
+    index = individual_profile.get_sampling_index().index
+    with create_writer("csv", str(tmp_path), index, 2021, "1h") as writer:
+        write_population(individual_profile, e_yearly, writer, root_seed=3, chunk_size=3, workers=1)
+    population = generate_population_parallel(individual_profile, e_yearly, root_seed=3, workers=1)
+    valid = ~np.isnan(e_yearly) & (e_yearly != 0.)
+    assert list(writer.combined.columns) == [f"{int(e)}kWh" for e in e_yearly[valid]]
+    np.testing.assert_array_equal(writer.combined.to_numpy().T, population[valid])
+    combined = pd.read_csv(writer.filenames[-1], index_col=0, parse_dates=True)
+    np.testing.assert_allclose(combined.to_numpy(), writer.combined.to_numpy())
+    assert len(writer.filenames) == valid.sum() + 1
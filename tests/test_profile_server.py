@@ -0,0 +1,64 @@
+import threading
+
+import numpy as np
+import pytest
+
+from domestic_hot_water.profile_server import PopulationBatcher, ProfileClient, ProfileServer
+from domestic_hot_water.session import Session
+from utility.definitions import household_generators
+from utility.instrumentation import profiling
+
+
+def test_bad_request_does_not_fail_its_batch(config_file):
+    session = Session(config_file)
+    batcher = PopulationBatcher(session, batch_window=0.5)
+    results = {}
+
+    def generate(name, root_seed):
+        try:
+            results[name] = batcher.generate([1500., 2400.], 2021, "1h", root_seed)[0]
+        except ValueError as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=generate, args=args) for args in (("good", 3), ("bad", -1))]
+    with profiling() as instrumentation:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert instrumentation.counters["server.batch_retries"] == 1
+    assert isinstance(results["bad"], ValueError)
+    np.testing.assert_array_equal(results["good"], session.population_profile(
+        [1500., 2400.], rng=household_generators(2, 3)))
+
+
+@pytest.mark.parametrize("body, message", [({"e_yearly": [1500., -1.]}, "not negative"),
+                                           ({"e_yearly": []}, "1 to 10"),
+                                           ({"e_yearly": [1500.] * 11}, "1 to 10"),
+                                           ({"e_yearly": [1500.], "seed": -1}, "seed"),
+                                           ({"e_yearly": [1500.], "resolution": "2h"}, "resolution"),
+                                           ({"e_yearly": [1500.], "year": 0}, "year"),
+                                           ({"e_yearly": [1500.], "year": 2201}, "year")])
+def test_invalid_requests_are_rejected(config_file, body, message):
+    with ProfileServer(Session(config_file), max_households=10) as server:
+        client = ProfileClient(server.url)
+        with pytest.raises(ValueError, match=message):
+            client.population(body["e_yearly"], year=body.get("year"), seed=body.get("seed", 0),
+                              resolution=body.get("resolution"))
+        assert client.population([1500., None]).shape == (2, 8760)
+
+
+def test_least_recently_used_profiles_are_released(config_file):
+    session = Session(config_file)
+    with ProfileServer(session, max_warm_profiles=2).warm_up([2021, 2022]) as server:
+        client = ProfileClient(server.url)
+        first = client.population([1500., 2400.], year=2021, seed=5)
+        client.population([1500.], year=2021, resolution="15min")
+        assert client.health()["warm_profiles"] == [[2021, "1h"], [2021, "15min"]]
+        assert session.warm_years() == [2021]
+        client.population([1500.], year=2022, resolution="15min")
+        assert client.health()["warm_profiles"] == [[2021, "15min"], [2022, "15min"]]
+        assert session.individual_profile(2021).sampling_index_keys() == [(2021, "15min")]
+        client.population([1500.], year=2022)
+        assert client.health()["warm_years"] == [2022]
+        np.testing.assert_array_equal(client.population([1500., 2400.], year=2021, seed=5), first)
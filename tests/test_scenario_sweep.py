@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from domestic_hot_water.domestic_hot_water_profile import IndividualHotWaterProfile
+from domestic_hot_water.scenario_sweep import ScenarioSweep
+
+# Light, medium, heavy and multiple heavy households, some close to the class and block boundaries
+e_yearly = np.array([300., 900., 1500., 2100., 2600., 3200., 4500., 6000., 9000., 15000., 30000., 1200.])
+
+
+def _points(n_points, seed=1):
+    rng = np.random.default_rng(seed)
+    points = []
+    for _ in range(n_points):
+        e = e_yearly * rng.choice([0.5, 0.9, 1., 1.1, 1.5, 3.], size=len(e_yearly))
+        e[rng.random(len(e)) < 0.1] = np.nan
+        e[rng.random(len(e)) < 0.1] = 0.
+        points.append({"e_yearly": e, "hot_water_temp": rng.choice([38., 40., 45., 55.]),
+                       "cold_water_temp": rng.choice([8., 12.]), "loss_coefficient": rng.choice([0.9, 1.])})
+    # A multiple heavy household losing blocks, then becoming heavy, light and back
+    for factor in (3., 2., 1., 0.2, 3.):
+        points.append({"e_yearly": e_yearly * factor})
+    return points
+
+
+def test_incremental_points_equal_fresh_sweeps(session):
+    individual_profile = session.individual_profile()
+    sweep = ScenarioSweep(individual_profile, e_yearly, root_seed=3)
+    for point in _points(25):
+        result = sweep.evaluate(heaters=True, **point)
+        fresh = ScenarioSweep(individual_profile, e_yearly, root_seed=3).evaluate(heaters=True, **point)
+        np.testing.assert_allclose(result.profiles, fresh.profiles, rtol=1e-9, atol=1e-9)
+        pd.testing.assert_frame_equal(result.metadata, fresh.metadata)
+        pd.testing.assert_frame_equal(result.heaters, fresh.heaters)
+
+
+def test_profiles_hold_the_yearly_volume(session):
+    sweep = ScenarioSweep(session.individual_profile(), e_yearly, root_seed=3)
+    for point in _points(10, seed=2):
+        result = sweep.evaluate(**point)
+        parameters = {name: point.get(name, getattr(IndividualHotWaterProfile, name))
+                      for name in ("hot_water_temp", "cold_water_temp", "loss_coefficient")}
+        e = point["e_yearly"]
+        valid = ~np.isnan(e) & (e != 0.)
+        vol_water_used = IndividualHotWaterProfile.calc_number_of_occupants(np.where(valid, e, 0.), **parameters)[0]
+        np.testing.assert_allclose(result.profiles.sum(axis=1), np.where(valid, vol_water_used, 0.), rtol=1e-9)
+        np.testing.assert_allclose(result.aggregate().values, result.profiles.sum(axis=0), rtol=1e-9, atol=1e-9)
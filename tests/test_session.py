@@ -0,0 +1,52 @@
+import numpy as np
+
+from domestic_hot_water.domestic_hot_water_definitions import WaterHeaterData
+from domestic_hot_water.profile_cache import profile_cache
+from domestic_hot_water.session import Session
+from utility.configuration import ConfigurationManager, config
+from utility.definitions import seed_global_random_states
+
+
+def test_sessions_do_not_share_config(config_file, tmp_path):
+    other_file = tmp_path / "other.ini"
+    other_file.write_text(open(config_file).read().replace("resolution = 1h", "resolution = 15min"))
+    default_filename = config.config_filename
+    hourly, quarter_hourly = Session(config_file), Session(str(other_file))
+    assert hourly.population_profile([1500.]).shape == (1, 8760)
+    assert quarter_hourly.population_profile([1500.]).shape == (1, 4 * 8760)
+    with quarter_hourly:
+        assert config.get("time", "resolution") == "15min"
+        with hourly:
+            assert config.get("time", "resolution") == "1h"
+        assert config.get("time", "resolution") == "15min"
+    assert config.active is config.default and config.config_filename == default_filename
+    assert hourly.profile_cache is not quarter_hourly.profile_cache is not profile_cache
+
+
+def test_cache_is_configured_again_after_load(config_file, tmp_path):
+    configuration = ConfigurationManager(config_file)
+    cache = profile_cache.with_configuration(configuration)
+    cache.put("a", np.zeros(10))
+    assert cache.max_entries == 32 and cache.directory is None
+    other_file = tmp_path / "other.ini"
+    other_file.write_text(open(config_file).read() + f"\n[cache]\nmax_entries = 2\ndirectory = {tmp_path / 'cache'}\n")
+    configuration.load(str(other_file))
+    np.testing.assert_array_equal(cache.get("a"), np.zeros(10))
+    assert cache.max_entries == 2 and cache.directory == str(tmp_path / "cache")
+
+
+def test_water_heater_data_of_session_and_class(config_file):
+    session = Session(config_file)
+    assert session.water_heater_data.get_heater_data(100)["Volume"] == 100
+    with session:
+        assert WaterHeaterData.max_w_heater_size == session.water_heater_data.max_w_heater_size == 200
+        assert WaterHeaterData.max_power == WaterHeaterData.water_heater_data["Power"].max()
+
+
+def test_legacy_path_is_reproducible_after_seeding(session):
+    individual_profile = session.individual_profile()
+    profiles = []
+    for _ in range(2):
+        seed_global_random_states()
+        profiles.append(individual_profile.get_individual_profile_from_e_yearly(1500.))
+    assert profiles[0].equals(profiles[1])
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+volumes = [0., 20., 30., 31.5, 50., 99.9, 100., 150., 199., 200., 201., 450., 1000.]
+powers = [0.5, 1.2, 1.25, 2.0, 2.3, 3.0, 3.01, 7.5]
+
+
+def _assert_rows_equal(batch, scalars, water_heater_data):
+    assert len(batch) == len(scalars)
+    for (_, row), scalar in zip(batch.iterrows(), scalars):
+        assert row["Heater"] == scalar.name
+        np.testing.assert_allclose(row[scalar.index].astype(float), scalar.astype(float))
+        assert row["Count"] == round(scalar["Volume"] / water_heater_data.water_heater_data.loc[scalar.name, "Volume"])
+
+
+@pytest.mark.parametrize("method, values", [("get_heater_data", volumes), ("find_heater_by_power", powers),
+                                            ("get_larger_heater_data", volumes)])
+def test_batch_lookups_equal_scalar_lookups(session, method, values):
+    water_heater_data = session.water_heater_data
+    if method == "get_larger_heater_data":
+        # The scalar lookup finds no heater larger than the largest one, see get_larger_heater_data_batch
+        with pytest.raises(IndexError):
+            water_heater_data.get_larger_heater_data(water_heater_data.max_w_heater_size)
+        values = [value for value in values if value != water_heater_data.max_w_heater_size]
+    batch = getattr(water_heater_data, f"{method}_batch")(values)
+    _assert_rows_equal(batch, [getattr(water_heater_data, method)(value) for value in values], water_heater_data)
+
+
+def test_largest_volume_gets_combined_heaters(session):
+    water_heater_data = session.water_heater_data
+    largest = water_heater_data.max_w_heater_size
+    _assert_rows_equal(water_heater_data.get_larger_heater_data_batch([largest]),
+                       [water_heater_data.get_multiple_water_heaters(vol_water_l=2 * largest)], water_heater_data)
@@ -0,0 +1,16 @@
+from os.path import join
+
+import pandas as pd
+import pytest
+
+from conftest import fixtures_directory
+from domestic_hot_water.domestic_hot_water_profile import DomesticHotWaterProfile
+
+
+@pytest.mark.parametrize("start, end", [("2021-01-01", "2021-12-31"), ("2024-01-01", "2024-12-31"),
+                                        ("2023-12-20", "2024-01-10")])
+def test_vectorized_days_equal_concatenated_get_day(session, start, end):
+    dhw_profile = DomesticHotWaterProfile(join(fixtures_directory, "dhwp.txt"), 2021, cache=None)
+    days_of_year = pd.date_range(start=start, end=end)
+    expected = pd.concat([dhw_profile.get_day(day) for day in days_of_year])
+    pd.testing.assert_frame_equal(dhw_profile.get_days(days_of_year), expected, check_exact=True)
@@ -1,20 +1,44 @@
 from configparser import RawConfigParser, ExtendedInterpolation
+from contextlib import contextmanager
+from contextvars import ContextVar
 from os import getcwd
 from os.path import join
 from sys import argv
 
 
 class ConfigurationManager:
-    """Manages the application's configuration settings."""
+    """Manages the application's configuration settings.
+
+    The file is only read on the first access of a setting, so creating the manager (and importing the modules that
+    use the global config) has no side effects and works without a config file."""
     def __init__(self, config_filename=join(getcwd(), "config", "config.ini")):
         """Initializes the ConfigurationManager."""
-        self.__config = RawConfigParser(allow_no_value=True, interpolation=ExtendedInterpolation())
-        self.__config.read_file(open(config_filename))
+        self.config_filename = config_filename
+        self.__parser = None
         self._registered_entries = {}
+        # Counts the loads, so that objects configured from this manager can tell they are out of date
+        self.generation = 0
+
+    @property
+    def __config(self):
+        if self.__parser is None:
+            parser = RawConfigParser(allow_no_value=True, interpolation=ExtendedInterpolation())
+            with open(self.config_filename) as f:
+                parser.read_file(f)
+            self.__parser = parser
+        return self.__parser
+
+    def load(self, config_filename):
+        """Switches to another config file, read on the next access of a setting."""
+        self.config_filename = config_filename
+        self.__parser = None
+        self.generation += 1
 
     def getarray(self, section, key, dtype=str, fallback=None):
-        """Gets a configuration value as an array."""
+        """Gets a configuration value as an array, a value without a comma gives a single element."""
         val = self._get(section, key, fallback=fallback)
+        if isinstance(val, str):
+            return [dtype(val)]
         try:
             return [dtype(v) for v in val]
         except TypeError:
@@ -66,6 +90,46 @@ class ConfigurationManager:
         return self.__config.has_option(section, option)
 
 
-# init_config
-config_file = argv[2] if len(argv) >= 3 else join(getcwd(), 'config', 'config.ini')
-config = ConfigurationManager(config_filename=config_file)
+class _ActiveConfiguration:
+    """The module-level config: every call goes to the ConfigurationManager made active by active_configuration in
+    the current thread or task, or to the default one read from the command line or config/config.ini."""
+    def __init__(self, default):
+        self.default = default
+
+    @property
+    def active(self):
+        return _active_configuration.get() or self.default
+
+    def __getattr__(self, name):
+        return getattr(self.active, name)
+
+
+_active_configuration = ContextVar("active_configuration", default=None)
+
+
+@contextmanager
+def active_configuration(configuration):
+    """Makes the module-level config, and so every ConfigValue, read configuration inside the with block, in this
+    thread or task only."""
+    token = _active_configuration.set(configuration)
+    try:
+        yield configuration
+    finally:
+        _active_configuration.reset(token)
+
+
+class ConfigValue:
+    """Class attribute that reads its value from the active config on access, instead of once at class creation."""
+    def __init__(self, section, key, getter="get"):
+        self.section = section
+        self.key = key
+        self.getter = getter
+
+    def __get__(self, instance, owner):
+        return getattr(config, self.getter)(self.section, self.key)
+
+
+# init_config, options like --profile do not count as positional arguments
+_arguments = [argument for argument in argv if not argument.startswith("--")]
+config_file = _arguments[2] if len(_arguments) >= 3 else join(getcwd(), 'config', 'config.ini')
+config = _ActiveConfiguration(ConfigurationManager(config_filename=config_file))
@@ -1,13 +1,52 @@
+import hashlib
 import warnings
 from enum import Enum
 
 warnings.filterwarnings("ignore", message="numpy.dtype size changed")
 warnings.filterwarnings("ignore", message="numpy.ufunc size changed")
 
+import numpy as np
 from numpy import random
 
 seed = 0
-random.seed(seed)
+# Seed of the random module, which the draw-offs of the legacy path without a numpy Generator come from
+legacy_seed = 42
+
+
+def seed_global_random_states(numpy_seed=seed, python_seed=legacy_seed):
+    """Seeds numpy's global random state and the random module, as importing the package used to.
+
+    Only the legacy path without a numpy Generator (get_individual_profile_from_e_yearly without rng) draws from
+    them; main() of generate_network_config.py calls this so its results stay reproducible."""
+    import random as python_random
+    random.seed(numpy_seed)
+    python_random.seed(python_seed)
+
+
+def household_seed_sequences(n_households, root_seed=seed):
+    """Spawns one independent SeedSequence per household from the root seed.
+
+    The i-th child only depends on the root seed and i, so households can be generated in any order or process."""
+    return random.SeedSequence(root_seed).spawn(n_households)
+
+
+def household_generators(n_households, root_seed=seed):
+    """Returns one numpy Generator per household, see household_seed_sequences."""
+    return [random.default_rng(seed_sequence) for seed_sequence in household_seed_sequences(n_households, root_seed)]
+
+
+def household_key_seed_sequence(key, root_seed=seed):
+    """Returns the SeedSequence of the household with the given key, a pure function of root seed and key.
+
+    An integer key i gives the same stream as household_seed_sequences(n, root_seed)[i], other keys (e.g. strings)
+    are hashed into the spawn key, so a household can be regenerated on its own without the households before it."""
+    if isinstance(key, (int, np.integer)) and not isinstance(key, bool) and key >= 0:
+        spawn_key = (int(key),)
+    else:
+        digest = hashlib.sha256(repr(key).encode()).digest()
+        # Two words, so hashed keys never collide with the single-word spawn keys of integer households
+        spawn_key = tuple(int.from_bytes(digest[i:i + 4], "little") for i in range(0, 8, 4))
+    return random.SeedSequence(root_seed, spawn_key=spawn_key)
 
 
 def suffix_or_empty(name, suffix='', no_trailing_separator=False, sep='_'):
@@ -0,0 +1,159 @@
+import json
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class _NullStage:
+    """Stage returned while instrumentation is disabled, entering and leaving it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class _Stage:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        if self.instrumentation.trace_memory:
+            self.instrumentation._enter_memory_scope()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = perf_counter() - self.start
+        stage = self.instrumentation.stages.setdefault(self.name, {"calls": 0, "seconds": 0.})
+        stage["calls"] += 1
+        stage["seconds"] += elapsed
+        if self.instrumentation.trace_memory:
+            peak = self.instrumentation._leave_memory_scope()
+            stage["peak_memory_bytes"] = max(stage.get("peak_memory_bytes", 0), peak)
+        return False
+
+
+class Instrumentation:
+    """Stage timers, counters and peak memory of a run.
+
+    Disabled by default: stage() then returns a shared no-op context manager and count() returns at once, so the
+    instrumented code pays one attribute check per call. Stages may nest, their times are inclusive. With
+    trace_memory, every stage also records the peak of the memory traced by tracemalloc while it ran, which slows
+    allocations down; the maximum resident set size of the process is reported either way."""
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self._memory_peaks = []
+
+    def enable(self, trace_memory=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_memory:
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def stage(self, name):
+        """Context manager timing the enclosed block as stage name."""
+        if not self.enabled:
+            return _null_stage
+        return _Stage(self, name)
+
+    def count(self, name, n=1):
+        """Adds n to the counter name."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, stages, counters):
+        """Adds the stages and counters of another process, e.g. a pool worker, to this one."""
+        if not self.enabled:
+            return
+        for name, other in stages.items():
+            stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.})
+            stage["calls"] += other["calls"]
+            stage["seconds"] += other["seconds"]
+            if "peak_memory_bytes" in other:
+                stage["peak_memory_bytes"] = max(stage.get("peak_memory_bytes", 0), other["peak_memory_bytes"])
+        for name, n in counters.items():
+            self.count(name, n)
+
+    def _enter_memory_scope(self):
+        # tracemalloc has a single peak: fold it into the enclosing stage before resetting it for this one
+        if self._memory_peaks:
+            self._memory_peaks[-1] = max(self._memory_peaks[-1], tracemalloc.get_traced_memory()[1])
+        self._memory_peaks.append(0)
+        tracemalloc.reset_peak()
+
+    def _leave_memory_scope(self):
+        peak = max(self._memory_peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self._memory_peaks:
+            self._memory_peaks[-1] = max(self._memory_peaks[-1], peak)
+        tracemalloc.reset_peak()
+        return peak
+
+    @staticmethod
+    def max_rss_bytes():
+        """Maximum resident set size of the process so far, None where the resource module is missing."""
+        if resource is None:
+            return None
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def report(self):
+        """Returns the stages (slowest first), counters and memory figures as a JSON serializable dict."""
+        stages = dict(sorted(self.stages.items(), key=lambda item: item[1]["seconds"], reverse=True))
+        return {"stages": stages, "counters": dict(self.counters), "max_rss_bytes": self.max_rss_bytes()}
+
+    def write_report(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"Profiling report written to: {filename}")
+
+
+instrumentation = Instrumentation()
+
+
+def timed(name):
+    """Decorator timing every call of the function as stage name of the global instrumentation."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+            with _Stage(instrumentation, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiling(trace_memory=False):
+    """Enables the global instrumentation for the enclosed block, starting from empty stages and counters."""
+    instrumentation.reset()
+    instrumentation.enable(trace_memory)
+    try:
+        yield instrumentation
+    finally:
+        instrumentation.disable()